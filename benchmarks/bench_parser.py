@@ -0,0 +1,134 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Compare the built-in wire parser with the generated class
+
+    python3 benchmarks/bench_parser.py
+    python3 benchmarks/bench_parser.py --all-backends
+
+With --all-backends, the benchmark is run again for each protobuf backend
+(python, cpp, upb) available in the installed protobuf package.
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+BACKENDS = ["python", "cpp", "upb"]
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-n", type=int, default=100000, help="number of messages")
+parser.add_argument("--all-backends", action="store_true", help="run with each backend")
+
+
+def new_payloads(n):
+    """build a set of realistic payloads"""
+    from pdns_protobuf_receiver.dnsmessage_pb2 import PBDNSMessage
+
+    payloads = []
+    for i in range(n):
+        dns_pb2 = PBDNSMessage()
+        dns_pb2.type = PBDNSMessage.Type.DNSResponseType
+        dns_pb2.messageId = os.urandom(16)
+        dns_pb2.serverIdentity = b"dnsdist"
+        dns_pb2.socketFamily = PBDNSMessage.SocketFamily.INET
+        dns_pb2.socketProtocol = PBDNSMessage.SocketProtocol.UDP
+        setattr(dns_pb2, "from", bytes([10, 0, i >> 8 & 0xFF, i & 0xFF]))
+        dns_pb2.to = b"\x7f\x00\x00\x01"
+        dns_pb2.inBytes = 120
+        dns_pb2.timeSec = 1600000000 + i
+        dns_pb2.timeUsec = i % 1000000
+        dns_pb2.id = i & 0xFFFF
+        dns_pb2.question.qName = "www%s.example.com." % i
+        dns_pb2.question.qType = 1
+        dns_pb2.question.qClass = 1
+        dns_pb2.response.rcode = 0
+        dns_pb2.response.queryTimeSec = 1600000000 + i
+        dns_pb2.response.queryTimeUsec = 0
+        rr = dns_pb2.response.rrs.add()
+        rr.name = dns_pb2.question.qName
+        rr.type = 1
+        rr.ttl = 300
+        rr.rdata = b"\x01\x02\x03\x04"
+        payloads.append(dns_pb2.SerializeToString())
+    return payloads
+
+
+def run(message_class, payloads):
+    """decode the payloads and read the hot fields, return messages per second"""
+    dns_pb2 = message_class()
+    start = time.perf_counter()
+    for payload in payloads:
+        dns_pb2.ParseFromString(payload)
+        (
+            dns_pb2.type,
+            dns_pb2.socketFamily,
+            dns_pb2.socketProtocol,
+            getattr(dns_pb2, "from"),
+            dns_pb2.to,
+            dns_pb2.timeSec,
+            dns_pb2.timeUsec,
+            dns_pb2.question.qName,
+            dns_pb2.question.qType,
+            dns_pb2.response.rcode,
+            dns_pb2.response.queryTimeSec,
+            dns_pb2.response.queryTimeUsec,
+            dns_pb2.inBytes,
+        )
+    return len(payloads) / (time.perf_counter() - start)
+
+
+def bench(n):
+    """run the benchmark with the current backend"""
+    from pdns_protobuf_receiver.dnsmessage_pb2 import PBDNSMessage
+    from pdns_protobuf_receiver import wire
+
+    payloads = new_payloads(n)
+    generated = run(PBDNSMessage, payloads)
+    fast = run(wire.WireMessage, payloads)
+
+    print(
+        "%-6s generated: %10.0f msg/s  fast parser: %10.0f msg/s  (x%.2f)"
+        % (wire.backend(), generated, fast, fast / generated)
+    )
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+    if not args.all_backends:
+        bench(args.n)
+        sys.exit(0)
+
+    for backend in BACKENDS:
+        env = dict(os.environ, PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=backend)
+        cmd = [sys.executable, os.path.abspath(__file__), "-n", str(args.n)]
+        proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            print("%-6s not available" % backend)
+            continue
+        sys.stdout.write(proc.stdout.decode())
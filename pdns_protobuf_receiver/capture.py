@@ -0,0 +1,222 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import gzip
+import glob
+import time
+import queue
+import struct
+import logging
+import threading
+
+# each captured frame is stored as the original 2 bytes length-prefixed
+# protobuf frame preceded by its arrival time in microseconds
+CAPTURE_HEADER = struct.Struct("!QH")
+
+CAPTURE_PREFIX = "capture-"
+CAPTURE_SUFFIX = ".pbcap.gz"
+CAPTURE_INDEX = "capture.idx"
+
+# compressed by the writer thread, favour speed at production rates
+CAPTURE_COMPRESSLEVEL = 3
+
+
+class CaptureWriter(object):
+    def __init__(
+        self,
+        path,
+        max_size=64 * 1024 * 1024,
+        batch_size=1024,
+        flush_interval=1.0,
+        max_pending=256,
+    ):
+        """prepare the class"""
+        self.path = path
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # current batch of (ts, payload), filled from the event loop
+        self.batch = []
+        self.last_flush = time.monotonic()
+        self.nb_dropped = 0
+
+        # writer thread state
+        self.fd = None
+        self.filename = None
+        self.size = 0
+        self.count = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.seq = 0
+
+        os.makedirs(self.path, exist_ok=True)
+
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self.run, name="capture", daemon=True)
+        self.thread.start()
+
+    def open_segment(self, ts):
+        """open a new segment file"""
+        self.seq += 1
+        self.filename = "%s%s-%06d%s" % (
+            CAPTURE_PREFIX,
+            time.strftime("%Y%m%d%H%M%S", time.gmtime(ts / 1000000)),
+            self.seq,
+            CAPTURE_SUFFIX,
+        )
+        self.fd = gzip.open(
+            os.path.join(self.path, self.filename), "wb", compresslevel=CAPTURE_COMPRESSLEVEL
+        )
+        self.size = 0
+        self.count = 0
+        self.first_ts = ts
+
+    def close_segment(self):
+        """close the current segment and record it in the index"""
+        if self.fd is None:
+            return
+
+        self.fd.close()
+        self.fd = None
+
+        with open(os.path.join(self.path, CAPTURE_INDEX), "a") as idx:
+            idx.write(
+                "%s %s %s %s\n"
+                % (self.filename, self.first_ts, self.last_ts, self.count)
+            )
+
+    def write(self, payload, ts=None):
+        """add the protobuf payload received at ts (microseconds) to the current batch"""
+        if ts is None:
+            ts = int(time.time() * 1000000)
+        self.batch.append((ts, payload))
+
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+        elif time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """hand over the current batch to the writer thread"""
+        self.last_flush = time.monotonic()
+        if not self.batch:
+            return
+
+        batch = self.batch
+        self.batch = []
+
+        # never block the event loop, drop the batch if the disk is too slow
+        try:
+            self.queue.put_nowait(batch)
+        except queue.Full:
+            self.nb_dropped += len(batch)
+            logging.warning("capture too slow, %s frames dropped" % self.nb_dropped)
+
+    def close(self):
+        """flush pending frames and stop the writer thread"""
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        """writer thread"""
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                logging.error("capture error: %s" % e)
+
+        self.close_segment()
+
+    def write_batch(self, batch):
+        """write the frames, compressed, rotating the segments"""
+        for ts, payload in batch:
+            if self.fd is None:
+                self.open_segment(ts)
+
+            self.fd.write(CAPTURE_HEADER.pack(ts, len(payload)))
+            self.fd.write(payload)
+
+            self.size += CAPTURE_HEADER.size + len(payload)
+            self.count += 1
+            self.last_ts = ts
+
+            if self.size >= self.max_size:
+                self.close_segment()
+
+
+class CaptureReader(object):
+    def __init__(self, path):
+        """prepare the class"""
+        self.path = path
+
+    def segments(self):
+        """list the segment files in capture order"""
+        segments = []
+
+        idx_path = os.path.join(self.path, CAPTURE_INDEX)
+        if os.path.exists(idx_path):
+            with open(idx_path, "r") as idx:
+                for line in idx:
+                    if line.strip():
+                        segments.append(line.split()[0])
+
+        # a segment still open when the capture stopped is not indexed
+        pattern = os.path.join(self.path, "%s*%s" % (CAPTURE_PREFIX, CAPTURE_SUFFIX))
+        for filename in sorted(glob.glob(pattern)):
+            filename = os.path.basename(filename)
+            if filename not in segments:
+                segments.append(filename)
+
+        return [os.path.join(self.path, f) for f in segments]
+
+    def frames(self):
+        """iterate over (timestamp, frame) tuples, frame includes its length header"""
+        for segment in self.segments():
+            with gzip.open(segment, "rb") as fd:
+                while True:
+                    try:
+                        hdr = fd.read(CAPTURE_HEADER.size)
+                    except EOFError:
+                        # truncated segment
+                        break
+                    if len(hdr) < CAPTURE_HEADER.size:
+                        break
+
+                    ts, datalen = CAPTURE_HEADER.unpack(hdr)
+                    try:
+                        payload = fd.read(datalen)
+                    except EOFError:
+                        break
+                    if len(payload) < datalen:
+                        break
+
+                    # the frame is the original length header and payload
+                    yield ts, hdr[8:] + payload
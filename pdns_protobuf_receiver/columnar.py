@@ -0,0 +1,294 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import json
+import time
+import queue
+import struct
+import logging
+import threading
+
+from array import array
+
+from pdns_protobuf_receiver.record import RECORD_VALUES, RESPONSE_TYPES, address_to_text
+
+# imported on first use, it is slow to load
+pyarrow = None
+
+
+def import_pyarrow():
+    """import pyarrow, return None when not installed"""
+    global pyarrow
+    if pyarrow is None:
+        try:
+            import pyarrow as module
+            import pyarrow.ipc
+        except ImportError:
+            return None
+        pyarrow = module
+    return pyarrow
+
+# fallback columnar format, see README
+COLUMNAR_MAGIC = b"PDNSCOL1"
+
+# name, array typecode
+COLUMNAR_NUMERIC = [
+    ("time", "Q"),
+    ("dns_message", "B"),
+    ("socket_family", "B"),
+    ("socket_protocol", "B"),
+    ("query_type", "H"),
+    ("return_code", "I"),
+    ("bytes", "Q"),
+    ("latency", "q"),
+]
+
+# dictionary encoded columns
+COLUMNAR_STRINGS = ["from_address", "to_address", "query_name", "listener"]
+
+ARROW_TYPES = {
+    "Q": "uint64",
+    "B": "uint8",
+    "H": "uint16",
+    "I": "uint32",
+    "q": "int64",
+}
+
+
+class ColumnarBatch(object):
+    def __init__(self, size):
+        """preallocate the typed columns"""
+        self.size = size
+        self.rows = 0
+        self.created = time.monotonic()
+
+        self.numeric = {}
+        for name, typecode in COLUMNAR_NUMERIC:
+            self.numeric[name] = array(typecode, [0]) * size
+
+        self.codes = {}
+        self.dictionaries = {}
+        for name in COLUMNAR_STRINGS:
+            self.codes[name] = array("I", [0]) * size
+            self.dictionaries[name] = {}
+
+    def encode(self, name, value):
+        """return the dictionary code of the value"""
+        dictionary = self.dictionaries[name]
+        code = dictionary.get(value)
+        if code is None:
+            code = dictionary[value] = len(dictionary)
+        return code
+
+    def append(self, dns_record):
+        """fill one row from the record"""
+        i = self.rows
+        numeric = self.numeric
+        codes = self.codes
+
+        (
+            msg_type,
+            family,
+            protocol,
+            from_addr,
+            to_addr,
+            query_time,
+            response_time,
+            qtype,
+            qname,
+            rcode,
+            nbytes,
+            listener,
+        ) = RECORD_VALUES(dns_record)
+
+        numeric["dns_message"][i] = msg_type
+        numeric["socket_family"][i] = family
+        numeric["socket_protocol"][i] = protocol
+        numeric["query_type"][i] = qtype
+        numeric["return_code"][i] = rcode
+        numeric["bytes"][i] = nbytes
+        if msg_type in RESPONSE_TYPES:
+            numeric["time"][i] = response_time
+            numeric["latency"][i] = response_time - query_time
+        else:
+            numeric["time"][i] = query_time
+            numeric["latency"][i] = 0
+
+        # addresses are dictionary encoded as raw bytes, converted once per batch
+        codes["from_address"][i] = self.encode("from_address", (family, from_addr))
+        codes["to_address"][i] = self.encode("to_address", (family, to_addr))
+        codes["query_name"][i] = self.encode("query_name", qname)
+        codes["listener"][i] = self.encode("listener", listener or "")
+
+        self.rows += 1
+        return self.rows >= self.size
+
+    def columns(self):
+        """return the filled part of the columns and the dictionaries as text"""
+        numeric = [(name, self.numeric[name][: self.rows]) for name, _ in COLUMNAR_NUMERIC]
+        strings = []
+        for name in COLUMNAR_STRINGS:
+            values = list(self.dictionaries[name])
+            if name in ("from_address", "to_address"):
+                values = [address_to_text(*v) for v in values]
+            strings.append((name, self.codes[name][: self.rows], values))
+        return numeric, strings
+
+
+def write_columnar(filepath, rows, numeric, strings):
+    """write the columns in the fallback format"""
+    header = {"rows": rows, "columns": []}
+    for name, col in numeric:
+        header["columns"].append({"name": name, "type": col.typecode, "itemsize": col.itemsize})
+    for name, col, values in strings:
+        header["columns"].append(
+            {"name": name, "type": col.typecode, "itemsize": col.itemsize, "dictionary": values}
+        )
+    header = json.dumps(header).encode()
+
+    with open(filepath, "wb") as fd:
+        fd.write(COLUMNAR_MAGIC)
+        fd.write(struct.pack("<I", len(header)))
+        fd.write(header)
+        for col in [c[1] for c in numeric] + [c[1] for c in strings]:
+            if sys.byteorder != "little":
+                col.byteswap()
+            fd.write(col.tobytes())
+
+
+def read_columnar(filepath):
+    """read a file in the fallback format, return a dict of columns"""
+    with open(filepath, "rb") as fd:
+        if fd.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise Exception("not a columnar file")
+        (header_len,) = struct.unpack("<I", fd.read(4))
+        header = json.loads(fd.read(header_len))
+
+        columns = {}
+        for column in header["columns"]:
+            col = array(column["type"])
+            col.frombytes(fd.read(column["itemsize"] * header["rows"]))
+            if sys.byteorder != "little":
+                col.byteswap()
+            if "dictionary" in column:
+                col = [column["dictionary"][c] for c in col]
+            columns[column["name"]] = col
+    return columns
+
+
+def write_arrow(filepath, rows, numeric, strings):
+    """write the columns as an arrow ipc file"""
+    arrays = []
+    names = []
+    for name, col in numeric:
+        arrow_type = getattr(pyarrow, ARROW_TYPES[col.typecode])()
+        arrays.append(
+            pyarrow.Array.from_buffers(arrow_type, rows, [None, pyarrow.py_buffer(col)])
+        )
+        names.append(name)
+    for name, col, values in strings:
+        indices = pyarrow.Array.from_buffers(
+            pyarrow.uint32(), rows, [None, pyarrow.py_buffer(col)]
+        )
+        arrays.append(pyarrow.DictionaryArray.from_arrays(indices, pyarrow.array(values)))
+        names.append(name)
+
+    table = pyarrow.Table.from_arrays(arrays, names=names)
+    with pyarrow.OSFile(filepath, "wb") as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+class ColumnarOutput(object):
+    def __init__(self, path, batch_size=65536, flush_interval=60.0, max_pending=4):
+        """prepare the class"""
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.seq = 0
+        self.nb_dropped = 0
+
+        if import_pyarrow() is not None:
+            self.writer, self.suffix = write_arrow, ".arrow"
+        else:
+            self.writer, self.suffix = write_columnar, ".pdnscol"
+
+        os.makedirs(self.path, exist_ok=True)
+
+        self.batch = ColumnarBatch(self.batch_size)
+
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self.run, name="columnar-output", daemon=True)
+        self.thread.start()
+
+    def write(self, dns_record):
+        """add the record to the current batch"""
+        if self.batch.append(dns_record):
+            self.rotate()
+
+    def flush(self):
+        """write the current batch if it is getting old"""
+        if self.batch.rows and time.monotonic() - self.batch.created >= self.flush_interval:
+            self.rotate()
+
+    def rotate(self):
+        """hand over the current batch to the writer thread"""
+        batch = self.batch
+        self.batch = ColumnarBatch(self.batch_size)
+        try:
+            self.queue.put_nowait(batch)
+        except queue.Full:
+            self.nb_dropped += batch.rows
+            logging.warning("columnar output too slow, %s records dropped" % self.nb_dropped)
+
+    def close(self):
+        """write the pending rows and stop the writer thread"""
+        if self.batch.rows:
+            self.queue.put(self.batch)
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        """writer thread"""
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+
+            # never overwrite the batch of a previous run in the same second
+            period = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+            while True:
+                self.seq += 1
+                filename = "pdns-%s-%04d%s" % (period, self.seq, self.suffix)
+                filepath = os.path.join(self.path, filename)
+                if not os.path.exists(filepath):
+                    break
+            try:
+                numeric, strings = batch.columns()
+                self.writer(filepath + ".tmp", batch.rows, numeric, strings)
+                os.replace(filepath + ".tmp", filepath)
+            except Exception as e:
+                logging.error("columnar output error: %s" % e)
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import json
+
+# keys of the configuration file for the single letter options
+CONFIG_ALIASES = {
+    "listen": "l",
+    "json": "j",
+    "verbose": "v",
+    "capture": "c",
+    "file": "f",
+}
+
+
+def load_config(path, options):
+    """load the json configuration file, return the values per option name
+
+    the keys are the long names of the command line options, or their aliases,
+    options is the set of the valid option names
+    """
+    with open(path, "r") as fd:
+        config = json.load(fd)
+    if not isinstance(config, dict):
+        raise ValueError("the configuration must be a json object")
+
+    values = {}
+    for key, value in config.items():
+        name = CONFIG_ALIASES.get(key, key.replace("-", "_"))
+        if name not in options:
+            raise ValueError("unknown option %s" % key)
+
+        # repeated options
+        if name in ("l", "exclude") and isinstance(value, (str, dict)):
+            value = [value]
+        if name == "exclude" and isinstance(value, list):
+            value = [
+                " ".join("%s=%s" % kv for kv in v.items()) if isinstance(v, dict) else v
+                for v in value
+            ]
+        values[name] = value
+    return values
+
+
+def config_argv(values, actions):
+    """convert the values to command line arguments, to validate them with the parser
+
+    actions are the argparse actions of the options
+    """
+    argv = []
+    for action in actions:
+        if action.dest not in values:
+            continue
+        value = values[action.dest]
+        option = action.option_strings[-1]
+
+        # flags are only set by the configuration
+        if isinstance(action, argparse._StoreTrueAction):
+            if not isinstance(value, bool):
+                raise ValueError("option %s expects true or false" % option.lstrip("-"))
+            if value:
+                argv.append(option)
+            continue
+
+        if isinstance(action, argparse._AppendAction):
+            if not isinstance(value, list):
+                raise ValueError("option %s expects a list" % option.lstrip("-"))
+        else:
+            value = [value]
+
+        for v in value:
+            if isinstance(v, (bool, list, dict)) or v is None:
+                raise ValueError("option %s expects a single value" % option.lstrip("-"))
+            if option.startswith("--"):
+                argv.append("%s=%s" % (option, v))
+            else:
+                argv.append("%s%s" % (option, v))
+    return argv
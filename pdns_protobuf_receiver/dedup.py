@@ -0,0 +1,88 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+import logging
+
+
+class Dedup(object):
+    def __init__(self, emit, window=1.0, max_entries=65536):
+        """prepare the class"""
+        self.emit = emit
+        self.window = window
+        self.max_entries = max_entries
+
+        # first record of each key of the bucket, with its repeat count
+        self.held = {}
+        self.start = time.monotonic()
+        self.overflow = 0
+
+    def process(self, dns_record):
+        """hold the first record of a key, count and drop the repeats"""
+        if time.monotonic() - self.start >= self.window:
+            self.rotate()
+
+        key = (
+            dns_record.dns_message,
+            dns_record.from_address,
+            dns_record.listener,
+            dns_record.query_name,
+            dns_record.query_type,
+            dns_record.return_code,
+        )
+        held = self.held.get(key)
+        if held is not None:
+            held.repeats += 1
+            return None
+
+        # bucket full, let the record go through
+        if len(self.held) >= self.max_entries:
+            self.overflow += 1
+            return dns_record
+
+        dns_record.repeats = 1
+        self.held[key] = dns_record
+        return None
+
+    def rotate(self):
+        """emit the records of the bucket and start a new one"""
+        held = self.held
+        self.held = {}
+        self.start = time.monotonic()
+
+        if self.overflow:
+            logging.debug("dedup bucket full, %s records not deduplicated" % self.overflow)
+            self.overflow = 0
+
+        for dns_record in held.values():
+            self.emit(dns_record)
+
+    def flush(self):
+        """rotate the bucket even when idle"""
+        if time.monotonic() - self.start >= self.window:
+            self.rotate()
+
+    def close(self):
+        """emit the held records"""
+        self.rotate()
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import math
+
+from collections import Counter, OrderedDict
+
+from pdns_protobuf_receiver.record import address_to_text, time_to_text
+
+# an alert is raised when one of the mean values of a client window crosses
+# its threshold
+DETECT_THRESHOLDS = {
+    "entropy": 3.5,
+    "label_length": 40,
+    "unique_ratio": 0.9,
+    "nxdomain_ratio": 0.5,
+}
+
+# bits of the per client bitmap used to estimate the number of unique subdomains
+UNIQUE_BITS = 1024
+
+NXDOMAIN = 3
+
+# only the responses sent to the clients, not the ones of the authoritative servers
+CLIENT_RESPONSE = 2
+
+
+def shannon_entropy(text):
+    """return the entropy in bits per character of the text"""
+    size = len(text)
+    if not size:
+        return 0.0
+    entropy = 0.0
+    for count in Counter(text).values():
+        p = count / size
+        entropy -= p * math.log2(p)
+    return entropy
+
+
+def split_name(qname, registered_domain=None):
+    """return the subdomain part of the name and its longest label length"""
+    name = qname.rstrip(".").lower()
+    labels = name.split(".")
+    if registered_domain is not None:
+        subdomain = name[: -len(registered_domain)].rstrip(".")
+    else:
+        subdomain = ".".join(labels[:-2])
+    return subdomain, max(len(label) for label in labels)
+
+
+class ClientWindow(object):
+    __slots__ = (
+        "start",
+        "responses",
+        "nxdomain",
+        "entropy",
+        "label_length",
+        "bitmap",
+    )
+
+    def __init__(self, start):
+        """start a new window"""
+        self.start = start
+        self.responses = 0
+        self.nxdomain = 0
+        self.entropy = 0.0
+        self.label_length = 0
+        self.bitmap = bytearray(UNIQUE_BITS // 8)
+
+    def add(self, subdomain, label_length, rcode):
+        """update the counters with one response"""
+        self.responses += 1
+        if rcode == NXDOMAIN:
+            self.nxdomain += 1
+        self.entropy += shannon_entropy(subdomain.replace(".", ""))
+        self.label_length += label_length
+
+        bit = hash(subdomain) % UNIQUE_BITS
+        self.bitmap[bit >> 3] |= 1 << (bit & 7)
+
+    def unique(self):
+        """estimate the number of unique subdomains with linear counting"""
+        zeros = UNIQUE_BITS - sum(bin(b).count("1") for b in self.bitmap)
+        if not zeros:
+            return self.responses
+        return min(self.responses, UNIQUE_BITS * math.log(UNIQUE_BITS / zeros))
+
+    def signals(self):
+        """return the mean values of the window"""
+        return {
+            "entropy": round(self.entropy / self.responses, 3),
+            "label_length": round(self.label_length / self.responses, 1),
+            "unique_ratio": round(self.unique() / self.responses, 3),
+            "nxdomain_ratio": round(self.nxdomain / self.responses, 3),
+        }
+
+
+class TunnelDetection(object):
+    def __init__(self, emit, window=100, max_clients=65536, thresholds=None):
+        """prepare the class"""
+        self.emit = emit
+        self.window = window
+        self.max_clients = max_clients
+        self.thresholds = dict(DETECT_THRESHOLDS)
+        if thresholds is not None:
+            self.thresholds.update(thresholds)
+
+        # least recently seen clients first
+        self.clients = OrderedDict()
+
+    def write(self, dns_record):
+        """update the window of the client with the response"""
+        if dns_record.dns_message != CLIENT_RESPONSE:
+            return
+
+        key = (dns_record.socket_family, dns_record.from_address, dns_record.listener)
+        client = self.clients.get(key)
+        if client is None:
+            client = self.clients[key] = ClientWindow(dns_record.response_time)
+            if len(self.clients) > self.max_clients:
+                self.clients.popitem(last=False)
+        else:
+            self.clients.move_to_end(key)
+
+        subdomain, label_length = split_name(
+            dns_record.query_name, dns_record.registered_domain
+        )
+        client.add(subdomain, label_length, dns_record.return_code)
+
+        if client.responses >= self.window:
+            del self.clients[key]
+            self.check(key, client, dns_record.response_time)
+
+    def check(self, key, client, end):
+        """emit an alert when a signal crosses its threshold"""
+        signals = client.signals()
+        crossed = [k for k, v in signals.items() if v >= self.thresholds[k]]
+        if not crossed:
+            return
+
+        family, from_addr, listener = key
+        alert = {}
+        alert["dns_message"] = "ALERT"
+        alert["from_address"] = address_to_text(family, from_addr)
+        alert["window_start"] = time_to_text(client.start)
+        alert["window_end"] = time_to_text(end)
+        alert["responses"] = client.responses
+        alert["signals"] = signals
+        alert["crossed"] = crossed
+        if listener is not None:
+            alert["listener"] = listener
+        self.emit(json.dumps(alert))
+
+    def flush(self):
+        """nothing to flush, windows are closed by the responses"""
+        pass
+
+    def close(self):
+        """forget the incomplete windows"""
+        self.clients.clear()
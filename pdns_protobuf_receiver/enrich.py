@@ -0,0 +1,277 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import time
+import socket
+import bisect
+import logging
+import functools
+import threading
+
+from array import array
+
+
+def ip_to_int(ip):
+    """convert an IPv4 or IPv6 address to (version, integer)"""
+    if ":" in ip:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+    return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+
+
+class IntervalIndex(object):
+    def __init__(self, ranges, typecode=None):
+        """build the index from non overlapping (start, end, value) ranges"""
+        ranges = sorted(ranges, key=lambda r: r[0])
+        self.starts = [r[0] for r in ranges]
+        self.ends = [r[1] for r in ranges]
+        self.values = [r[2] for r in ranges]
+
+        # compact storage for IPv4
+        if typecode is not None:
+            self.starts = array(typecode, self.starts)
+            self.ends = array(typecode, self.ends)
+
+    def lookup(self, ip):
+        """return the value of the range containing the address, or None"""
+        i = bisect.bisect_right(self.starts, ip) - 1
+        if i >= 0 and ip <= self.ends[i]:
+            return self.values[i]
+        return None
+
+    def __len__(self):
+        return len(self.values)
+
+
+def load_database(path):
+    """load a range database, one <start ip>,<end ip>,<asn>,<country> line per range
+
+    tabs can be used instead of commas, additional columns are ignored
+    """
+    ranges4 = []
+    ranges6 = []
+
+    # values are shared between the ranges of the same network
+    values = {}
+
+    with open(path, "r", encoding="utf-8", errors="replace") as fd:
+        for line in fd:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            fields = line.split("\t") if "\t" in line else line.split(",")
+            try:
+                version, start = ip_to_int(fields[0].strip())
+                _, end = ip_to_int(fields[1].strip())
+                asn = int(fields[2].strip().upper().lstrip("AS") or 0)
+                country = fields[3].strip() if len(fields) > 3 else ""
+            except (ValueError, OSError, IndexError):
+                # header or malformed line
+                continue
+
+            # not routed
+            if asn == 0:
+                continue
+
+            value = values.setdefault((asn, country), (asn, country))
+            if version == 4:
+                ranges4.append((start, end, value))
+            else:
+                ranges6.append((start, end, value))
+
+    return IntervalIndex(ranges4, "I"), IntervalIndex(ranges6)
+
+
+class GeoEnrichment(object):
+    def __init__(self, path, cache_size=65536, reload_interval=10.0):
+        """prepare the class"""
+        self.path = path
+        self.cache_size = cache_size
+        self.reload_interval = reload_interval
+
+        self.mtime = os.stat(path).st_mtime
+        self.index4, self.index6 = load_database(path)
+        self.reset_cache()
+        logging.debug(
+            "geo database loaded: %s IPv4 and %s IPv6 ranges"
+            % (len(self.index4), len(self.index6))
+        )
+
+        self.last_check = time.monotonic()
+        self.loading = None
+        self.loaded = None
+
+    def reset_cache(self):
+        """new bounded cache, keyed by raw address"""
+        self.lookup = functools.lru_cache(maxsize=self.cache_size)(self.lookup_address)
+
+    def lookup_address(self, addr):
+        """return (asn, country) of the raw address, or None"""
+        if len(addr) == 4:
+            return self.index4.lookup(int.from_bytes(addr, "big"))
+        if len(addr) == 16:
+            return self.index6.lookup(int.from_bytes(addr, "big"))
+        return None
+
+    def process(self, dns_record):
+        """add the asn and country of the client"""
+        value = self.lookup(dns_record.from_address)
+        if value is not None:
+            dns_record.from_asn, dns_record.from_country = value
+        return dns_record
+
+    def flush(self):
+        """reload the database when the file has changed"""
+        if self.loading is not None and not self.loading.is_alive():
+            self.loading = None
+
+        if self.loaded is not None:
+            self.index4, self.index6 = self.loaded
+            self.loaded = None
+            self.reset_cache()
+            logging.info(
+                "geo database reloaded: %s IPv4 and %s IPv6 ranges"
+                % (len(self.index4), len(self.index6))
+            )
+
+        if self.loading is not None or time.monotonic() - self.last_check < self.reload_interval:
+            return
+        self.last_check = time.monotonic()
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime == self.mtime:
+            return
+
+        # load the new database without blocking the event loop
+        self.mtime = mtime
+        self.loading = threading.Thread(target=self.reload, name="geo-reload", daemon=True)
+        self.loading.start()
+
+    def reload(self):
+        """load the database, swapped in by the event loop"""
+        try:
+            self.loaded = load_database(self.path)
+        except Exception as e:
+            logging.error("unable to reload the geo database - %s" % e)
+
+    def close(self):
+        """nothing to release"""
+        pass
+
+
+# flags of the public suffix rules, stored in the trie nodes under the None key
+RULE = 1
+EXCEPTION = 2
+
+
+class SuffixTrie(object):
+    def __init__(self, rules):
+        """compile the public suffix rules in a trie of reversed labels"""
+        self.root = {}
+        self.count = 0
+        for rule in rules:
+            flag = RULE
+            if rule.startswith("!"):
+                flag = EXCEPTION
+                rule = rule[1:]
+
+            node = self.root
+            for label in reversed(rule.split(".")):
+                node = node.setdefault(label, {})
+            node[None] = flag
+            self.count += 1
+
+    def suffix_length(self, labels):
+        """return the number of labels of the public suffix, at least one"""
+        node = self.root
+        suffix = 1
+        for depth, label in enumerate(reversed(labels), 1):
+            child = node.get(label)
+            if child is None:
+                if "*" in node:
+                    suffix = depth
+                break
+
+            flag = child.get(None)
+            if flag == EXCEPTION:
+                suffix = depth - 1
+                break
+            if flag == RULE or "*" in node:
+                suffix = depth
+            node = child
+        return suffix
+
+    def registered_domain(self, qname):
+        """return the public suffix plus one label of the name, or None"""
+        labels = qname.rstrip(".").lower().split(".")
+        suffix = self.suffix_length(labels)
+        if len(labels) <= suffix:
+            return None
+        return ".".join(labels[-suffix - 1 :])
+
+    def __len__(self):
+        return self.count
+
+
+def load_public_suffix_list(path):
+    """load the rules of a public_suffix_list.dat file"""
+    rules = []
+    with open(path, "r", encoding="utf-8") as fd:
+        for line in fd:
+            rule = line.split()[0] if line.strip() else ""
+            if not rule or rule.startswith("//"):
+                continue
+
+            # query names are received in their ascii form
+            try:
+                rule = rule.encode("idna").decode("ascii")
+            except UnicodeError:
+                pass
+            rules.append(rule.lower())
+    return SuffixTrie(rules)
+
+
+class DomainEnrichment(object):
+    def __init__(self, path, cache_size=65536):
+        """prepare the class"""
+        self.trie = load_public_suffix_list(path)
+        self.lookup = functools.lru_cache(maxsize=cache_size)(self.trie.registered_domain)
+        logging.debug("public suffix list loaded: %s rules" % len(self.trie))
+
+    def process(self, dns_record):
+        """add the registered domain of the query name"""
+        dns_record.registered_domain = self.lookup(dns_record.query_name)
+        return dns_record
+
+    def flush(self):
+        """nothing to flush"""
+        pass
+
+    def close(self):
+        """nothing to release"""
+        pass
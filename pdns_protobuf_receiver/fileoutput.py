@@ -0,0 +1,222 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import gzip
+import json
+import time
+import queue
+import logging
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FILE_COMPRESS = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+
+class FileOutput(object):
+    def __init__(
+        self,
+        path,
+        rotate_interval=3600,
+        rotate_size=512 * 1024 * 1024,
+        compress="gzip",
+        batch_size=1024,
+        flush_interval=1.0,
+        max_pending=256,
+    ):
+        """prepare the class"""
+        if compress == "zstd" and zstandard is None:
+            raise Exception("zstd compression requires the zstandard package")
+
+        self.path = path
+        self.rotate_interval = rotate_interval
+        self.rotate_size = rotate_size
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # current batch, filled from the event loop
+        self.batch = []
+        self.batch_first = None
+        self.last_flush = time.monotonic()
+        self.nb_dropped = 0
+
+        # writer thread state
+        self.fd = None
+        self.raw = None
+        self.filename = None
+        self.period = None
+        self.seq = 0
+        self.size = 0
+        self.count = 0
+        self.first_ts = None
+        self.last_ts = None
+
+        os.makedirs(self.path, exist_ok=True)
+
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self.run, name="file-output", daemon=True)
+        self.thread.start()
+
+    def write(self, dns_json):
+        """add the json payload to the current batch"""
+        if not self.batch:
+            self.batch_first = time.time()
+        self.batch.append(dns_json)
+
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+        elif time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """hand over the current batch to the writer thread"""
+        self.last_flush = time.monotonic()
+        if not self.batch:
+            return
+
+        batch = (self.batch_first, time.time(), self.batch)
+        self.batch = []
+
+        # never block the event loop, drop the batch if the disk is too slow
+        try:
+            self.queue.put_nowait(batch)
+        except queue.Full:
+            self.nb_dropped += len(batch[2])
+            logging.warning("file output too slow, %s records dropped" % self.nb_dropped)
+
+    def close(self):
+        """flush pending records and stop the writer thread"""
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        """writer thread"""
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+
+            try:
+                self.write_batch(*batch)
+            except Exception as e:
+                logging.error("file output error: %s" % e)
+
+        self.close_file()
+
+    def write_batch(self, first_ts, last_ts, records):
+        """write a batch of records in one call"""
+        period = int(first_ts // self.rotate_interval) * self.rotate_interval
+        if self.fd is not None and (
+            period != self.period or self.size >= self.rotate_size
+        ):
+            self.close_file()
+
+        if self.fd is None:
+            self.open_file(period, first_ts)
+
+        data = "\n".join(records).encode() + b"\n"
+        self.fd.write(data)
+
+        self.size += len(data)
+        self.count += len(records)
+        self.last_ts = last_ts
+
+        # the metadata never counts records which are not on the disk yet
+        self.sync_file()
+        self.write_meta(closed=False)
+
+    def open_file(self, period, ts):
+        """open a new file for the time period"""
+        if period != self.period:
+            self.seq = 0
+        self.seq += 1
+        self.period = period
+
+        # never append to the file of a previous run, its metadata would be lost
+        while True:
+            self.filename = "pdns-%s-%04d.json%s" % (
+                time.strftime("%Y%m%d-%H%M%S", time.gmtime(period)),
+                self.seq,
+                FILE_COMPRESS[self.compress],
+            )
+            filepath = os.path.join(self.path, self.filename)
+            if not os.path.exists(filepath) and not os.path.exists(filepath + ".meta"):
+                break
+            self.seq += 1
+
+        # large buffered writes
+        self.raw = open(filepath, "ab", buffering=1024 * 1024)
+        if self.compress == "gzip":
+            self.fd = gzip.GzipFile(fileobj=self.raw, mode="ab", compresslevel=6)
+        elif self.compress == "zstd":
+            self.fd = zstandard.ZstdCompressor().stream_writer(self.raw)
+        else:
+            self.fd = self.raw
+
+        self.size = 0
+        self.count = 0
+        self.first_ts = ts
+        self.last_ts = ts
+
+    def sync_file(self):
+        """push the batch through the compressor and the file buffer to the disk"""
+        if self.compress == "gzip":
+            self.fd.flush()
+        elif self.compress == "zstd":
+            self.fd.flush(zstandard.FLUSH_BLOCK)
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+
+    def close_file(self):
+        """close the current file and finalize its metadata"""
+        if self.fd is None:
+            return
+
+        self.fd.close()
+        if self.raw is not self.fd and not self.raw.closed:
+            self.raw.close()
+        self.write_meta(closed=True)
+
+        self.fd = None
+        self.raw = None
+
+    def write_meta(self, closed):
+        """atomically record the time range of the current file"""
+        meta = {
+            "file": self.filename,
+            "first": self.first_ts,
+            "last": self.last_ts,
+            "count": self.count,
+            "closed": closed,
+        }
+        metapath = os.path.join(self.path, "%s.meta" % self.filename)
+        with open(metapath + ".tmp", "w") as fd:
+            json.dump(meta, fd)
+        os.replace(metapath + ".tmp", metapath)
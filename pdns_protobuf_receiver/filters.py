@@ -0,0 +1,119 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import random
+import ipaddress
+
+from urllib.parse import parse_qsl
+
+import dns.rcode
+import dns.rdatatype
+
+
+def parse_filter(text):
+    """parse key=value pairs separated by spaces or &, return a list of pairs"""
+    return parse_qsl(text.strip().replace(" ", "&"))
+
+
+class RecordFilter(object):
+    def __init__(self, filters):
+        """compile the (key, value) filters, raise ValueError when invalid"""
+        self.suffix = None
+        self.network = None
+        self.rcode = None
+        self.qtype = None
+
+        for key, value in filters:
+            if key == "qname":
+                self.suffix = value.lower().strip(".") + "."
+            elif key == "client":
+                network = ipaddress.ip_network(value, strict=False)
+                self.network = (
+                    network.max_prefixlen // 8,
+                    int(network.network_address),
+                    int(network.netmask),
+                )
+            elif key == "rcode":
+                try:
+                    self.rcode = dns.rcode.from_text(value)
+                except dns.rcode.UnknownRcode:
+                    raise ValueError("unknown rcode %s" % value)
+            elif key == "qtype":
+                try:
+                    self.qtype = dns.rdatatype.from_text(value)
+                except dns.rdatatype.UnknownRdatatype:
+                    raise ValueError("unknown qtype %s" % value)
+            else:
+                raise ValueError("unknown filter %s" % key)
+
+    def match(self, dns_record):
+        """return True when the record matches the filters"""
+        if self.rcode is not None and dns_record.return_code != self.rcode:
+            return False
+
+        if self.qtype is not None and dns_record.query_type != self.qtype:
+            return False
+
+        if self.suffix is not None:
+            qname = dns_record.query_name.lower()
+            if not qname.endswith(self.suffix):
+                return False
+            if len(qname) > len(self.suffix) and qname[-len(self.suffix) - 1] != ".":
+                return False
+
+        if self.network is not None:
+            size, network, netmask = self.network
+            addr = dns_record.from_address
+            if len(addr) != size or int.from_bytes(addr, "big") & netmask != network:
+                return False
+
+        return True
+
+
+class FilterStage(object):
+    def __init__(self, exclude=(), sampling=1.0):
+        """prepare the class, exclude is a list of key=value filters"""
+        if not 0 < sampling <= 1:
+            raise ValueError("sampling must be in ]0, 1]")
+
+        self.exclude = [RecordFilter(parse_filter(text)) for text in exclude]
+        self.sampling = sampling
+
+    def process(self, dns_record):
+        """drop the excluded records, then keep a sample of the others"""
+        for record_filter in self.exclude:
+            if record_filter.match(dns_record):
+                return None
+
+        if self.sampling < 1.0 and random.random() >= self.sampling:
+            return None
+        return dns_record
+
+    def flush(self):
+        """nothing to flush"""
+        pass
+
+    def close(self):
+        """nothing to release"""
+        pass
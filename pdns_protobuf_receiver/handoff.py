@@ -0,0 +1,138 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import json
+import socket
+import struct
+import subprocess
+
+# file descriptor of the channel with the previous process, in the new one
+HANDOFF_ENV = "PDNS_PROTOBUF_RECEIVER_HANDOFF"
+
+# socket.send_fds and socket.recv_fds appeared in 3.9, sys.orig_argv in 3.10
+HANDOFF_MIN_VERSION = (3, 10)
+
+# time given to the new process to be ready
+HANDOFF_TIMEOUT = 10.0
+
+# socket buffers of the channel, 1MB, room for a few messages of one connection
+# with its unprocessed bytes, each below 256KB
+HANDOFF_BUFSIZE = 1024 * 1024
+HANDOFF_MAXFDS = 64
+
+# python 3.13 removes the socket file when a unix server is closed, the file is
+# kept for the new process and removed by the receiver itself at shutdown
+UNIX_SERVER_OPTIONS = {"cleanup_socket": False} if sys.version_info >= (3, 13) else {}
+
+
+def supported():
+    """return True if the python version can pass the sockets to a new process"""
+    return sys.version_info >= HANDOFF_MIN_VERSION
+
+
+def channel_pair():
+    """return the (previous, new) ends of a message channel"""
+    previous, new = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    previous.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, HANDOFF_BUFSIZE)
+    new.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, HANDOFF_BUFSIZE)
+    return previous, new
+
+
+def spawn(channel):
+    """start the new process with the same command line"""
+    argv = sys.orig_argv
+    env = dict(os.environ)
+    env[HANDOFF_ENV] = str(channel.fileno())
+    return subprocess.Popen(argv, env=env, pass_fds=[channel.fileno()])
+
+
+def inherited_channel():
+    """return the channel with the previous process, or None"""
+    fd = os.environ.pop(HANDOFF_ENV, None)
+    if fd is None:
+        return None
+    return socket.socket(fileno=int(fd))
+
+
+def send_message(channel, header, fds=(), data=b""):
+    """send the json header, the file descriptors and the data"""
+    message = json.dumps(header).encode() + b"\n" + data
+    socket.send_fds(channel, [message], list(fds))
+
+
+def recv_message(channel):
+    """return (header, fds, data), or None when the channel is closed"""
+    message, fds, flags, addr = socket.recv_fds(channel, HANDOFF_BUFSIZE, HANDOFF_MAXFDS)
+    if not message:
+        return None
+    header, data = message.split(b"\n", 1)
+    return json.loads(header), fds, data
+
+
+def send_listeners(channel, servers, tail_sock=None):
+    """send the listening sockets, servers maps the listeners to their servers"""
+    listeners = []
+    fds = []
+    for listener, server_list in servers.items():
+        for server in server_list:
+            for sock in server.sockets:
+                listeners.append(listener)
+                fds.append(sock.fileno())
+
+    # the socket of the live tail is the last one
+    if tail_sock is not None:
+        fds.append(tail_sock.fileno())
+
+    send_message(channel, {"listeners": listeners, "tail": tail_sock is not None}, fds)
+    return len(fds)
+
+
+def recv_listeners(channel):
+    """return the listening sockets per listener, and the one of the tail"""
+    channel.settimeout(HANDOFF_TIMEOUT)
+    message = recv_message(channel)
+    if message is None:
+        raise Exception("channel closed by the previous process")
+
+    header, fds, data = message
+    socks = {}
+    for listener, fd in zip(header["listeners"], fds):
+        socks.setdefault(tuple(listener), []).append(socket.socket(fileno=fd))
+
+    tail_sock = None
+    if header["tail"]:
+        tail_sock = socket.socket(fileno=fds[-1])
+    return socks, tail_sock
+
+
+def unprocessed(reader, streamer):
+    """return the bytes read from the connection and not processed yet"""
+    data = b""
+    if streamer.datalen is not None:
+        data = struct.pack("!H", streamer.datalen)
+    # asyncio has no public api to take the bytes buffered by the stream reader,
+    # the private _buffer is read, check it when upgrading python
+    return data + streamer.buf + bytes(reader._buffer)
@@ -28,11 +28,11 @@ import asyncio
 import socket
 import json
 import sys
-
-import dns.rdatatype
-import dns.rcode
-
-from datetime import datetime, timezone
+import os
+import shutil
+import signal
+import stat
+import errno
 
 # wget https://raw.githubusercontent.com/PowerDNS/dnsmessage/master/dnsmessage.proto
 # wget https://github.com/protocolbuffers/protobuf/releases/download/v3.12.2/protoc-3.12.2-linux-x86_64.zip
@@ -41,99 +41,288 @@ from datetime import datetime, timezone
 
 from pdns_protobuf_receiver.dnsmessage_pb2 import PBDNSMessage
 from pdns_protobuf_receiver import protobuf
+from pdns_protobuf_receiver import record
+from pdns_protobuf_receiver.capture import CaptureWriter
+from pdns_protobuf_receiver.fileoutput import FileOutput, FILE_COMPRESS
+from pdns_protobuf_receiver.columnar import ColumnarOutput
+from pdns_protobuf_receiver.stats import WindowStats
+from pdns_protobuf_receiver import wire
+from pdns_protobuf_receiver.relay import RelayOutput
+from pdns_protobuf_receiver.stdoutput import StdoutOutput
+from pdns_protobuf_receiver.scheduler import Scheduler
+from pdns_protobuf_receiver.enrich import GeoEnrichment, DomainEnrichment
+from pdns_protobuf_receiver.detect import TunnelDetection
+from pdns_protobuf_receiver.dedup import Dedup
+from pdns_protobuf_receiver.tail import TailServer
+from pdns_protobuf_receiver.filters import FilterStage
+from pdns_protobuf_receiver.config import load_config, config_argv
+from pdns_protobuf_receiver import handoff
 
 parser = argparse.ArgumentParser()
 parser.add_argument(
     "-l",
-    default="0.0.0.0:50001",
-    help="listen protobuf dns message on tcp/ip address <ip:port>",
+    action="append",
+    help="listen protobuf dns message on tcp/ip address [label=]<ip:port> or "
+    "[label=]unix:<path>, can be repeated (default 0.0.0.0:50001)",
+)
+parser.add_argument(
+    "-j", help="write JSON payload to tcp/ip address <ip:port> or unix:<path>"
 )
-parser.add_argument("-j", help="write JSON payload to tcp/ip address <ip:port>")
 parser.add_argument("-v", action="store_true", help="verbose mode")
+parser.add_argument("-c", help="capture raw protobuf frames to the directory <path>")
+parser.add_argument(
+    "--capture-size",
+    type=int,
+    default=64,
+    help="rotate capture segments after <size> megabytes",
+)
+parser.add_argument("-f", help="write JSON payload to rotated files in the directory <path>")
+parser.add_argument(
+    "--file-rotate-interval",
+    type=int,
+    default=3600,
+    help="start a new file every <seconds>",
+)
+parser.add_argument(
+    "--file-rotate-size",
+    type=int,
+    default=512,
+    help="start a new file after <size> megabytes",
+)
+parser.add_argument(
+    "--file-compress",
+    choices=list(FILE_COMPRESS),
+    default="gzip",
+    help="compression of the files",
+)
+parser.add_argument(
+    "--columnar", help="write columnar batches to the directory <path>"
+)
+parser.add_argument(
+    "--columnar-batch",
+    type=int,
+    default=65536,
+    help="number of rows per columnar batch",
+)
+parser.add_argument(
+    "--stats",
+    type=int,
+    metavar="SECONDS",
+    help="emit a statistics record every <seconds>",
+)
+parser.add_argument(
+    "--fast-parser",
+    action="store_true",
+    help="decode only the used fields with the built-in wire parser",
+)
+parser.add_argument(
+    "--relay",
+    help="relay protobuf messages as PBDNSMessageList to tcp/ip address <ip:port> or unix:<path>",
+)
+parser.add_argument(
+    "--unix-mode",
+    default="660",
+    help="permissions of the unix listening socket, in octal",
+)
+parser.add_argument("--unix-group", help="group of the unix listening socket")
+parser.add_argument(
+    "--budget-frames",
+    type=int,
+    default=64,
+    help="maximum number of frames processed per connection in turn",
+)
+parser.add_argument(
+    "--budget-bytes",
+    type=int,
+    default=65536,
+    help="maximum number of bytes processed per connection in turn",
+)
+parser.add_argument(
+    "--geo-db",
+    help="add the asn and country of the client from the ip ranges database <path>",
+)
+parser.add_argument(
+    "--geo-cache",
+    type=int,
+    default=65536,
+    help="number of client addresses kept in the geo cache",
+)
+parser.add_argument(
+    "--psl",
+    help="add the registered domain of the query name from the public suffix list <path>",
+)
+parser.add_argument(
+    "--psl-cache",
+    type=int,
+    default=65536,
+    help="number of query names kept in the registered domain cache",
+)
+parser.add_argument(
+    "--tail",
+    help="stream the records matching the filters of the subscribers connected to "
+    "<ip:port> or unix:<path>",
+)
+parser.add_argument(
+    "--tail-queue",
+    type=int,
+    default=1000,
+    help="number of records queued per subscriber, the oldest ones are dropped",
+)
+parser.add_argument(
+    "--dedup",
+    type=float,
+    metavar="SECONDS",
+    help="collapse the identical records received within <seconds> with a repeat count",
+)
+parser.add_argument(
+    "--dedup-entries",
+    type=int,
+    default=65536,
+    help="maximum number of distinct records held per dedup window",
+)
+parser.add_argument(
+    "--detect",
+    action="store_true",
+    help="emit alert records on tunneling or DGA signals per client",
+)
+parser.add_argument(
+    "--detect-window",
+    type=int,
+    default=100,
+    help="number of responses per client analysed together",
+)
+parser.add_argument(
+    "--detect-clients",
+    type=int,
+    default=65536,
+    help="maximum number of clients tracked, the least recent ones are forgotten",
+)
+parser.add_argument(
+    "--exclude",
+    action="append",
+    help="drop the records matching the filters 'key=value ...' on qname, client, "
+    "rcode or qtype, can be repeated",
+)
+parser.add_argument(
+    "--sampling",
+    type=float,
+    default=1.0,
+    help="ratio of the records kept after the exclusions, between 0 and 1",
+)
+parser.add_argument(
+    "--config",
+    help="read the options from the json file <path>, reloaded on SIGHUP",
+)
+
+UNIX_PREFIX = "unix:"
+
 
-PBDNSMESSAGE_TYPE = {
-    1: "CLIENT_QUERY",
-    2: "CLIENT_RESPONSE",
-    3: "AUTH_QUERY",
-    4: "AUTH_RESPONSE",
-}
-PBDNSMESSAGE_SOCKETFAMILY = {1: "IPv4", 2: "IPv6"}
+DEFAULT_LISTEN = "0.0.0.0:50001"
+
+# time given to the outputs connections to send their buffers at exit
+SHUTDOWN_TIMEOUT = 10.0
+
+# options only read at startup, the other ones are reloaded on SIGHUP
+CONFIG_STATIC = (
+    "j",
+    "v",
+    "fast_parser",
+    "relay",
+    "unix_mode",
+    "unix_group",
+    "budget_frames",
+    "budget_bytes",
+    "tail",
+    "tail_queue",
+    "stats",
+)
 
-PBDNSMESSAGE_SOCKETPROTOCOL = {1: "UDP", 2: "TCP"}
 
+def parse_args(argv=None):
+    """parse the command line, on top of the configuration file if any"""
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parser.parse_args(argv)
+    if args.config is None:
+        return args
 
-async def cb_onpayload(dns_pb2, payload, tcp_writer, debug_mode, loop):
+    # the values of the file are parsed as arguments, before the command line ones
+    options = set(action.dest for action in parser._actions) - set(["help", "config"])
+    values = load_config(args.config, options)
+    return parser.parse_args(config_argv(values, parser._actions) + argv)
+
+
+def parse_address(address):
+    """parse <ip:port> or unix:<path>, return (ip, port, None) or (None, None, path)"""
+    if address.startswith(UNIX_PREFIX):
+        path = address[len(UNIX_PREFIX) :]
+        if not path:
+            raise ValueError("empty unix socket path")
+        return None, None, path
+
+    ip, port = address.rsplit(":", 1)
+    if ip.startswith("[") and ip.endswith("]"):
+        ip = ip[1:-1]
+    return ip, int(port), None
+
+
+def parse_listener(listener):
+    """parse [label=]<address>, return (label, ip, port, path)"""
+    label = None
+    if "=" in listener:
+        name, address = listener.split("=", 1)
+        if name and ":" not in name and "/" not in name:
+            label, listener = name, address
+
+    return (label,) + parse_address(listener)
+
+
+def parse_listeners(args):
+    """parse the listen addresses, raise ValueError on the first bad one"""
+    listeners = []
+    for listen in args.l or [DEFAULT_LISTEN]:
+        try:
+            listeners.append(parse_listener(listen))
+        except Exception as e:
+            raise ValueError("bad listen ip:port provided - %s" % listen)
+    return listeners
+
+
+def cb_onpayload(dns_pb2, payload, tcp_writer, outputs, loop, listener=None):
     """on dnsmessage protobuf2"""
     dns_pb2.ParseFromString(payload)
 
-    dns_msg = {}
-    dns_msg["dns_message"] = PBDNSMESSAGE_TYPE[dns_pb2.type]
-    dns_msg["socket_family"] = PBDNSMESSAGE_SOCKETFAMILY[dns_pb2.socketFamily]
-    dns_msg["socket protocol"] = PBDNSMESSAGE_SOCKETPROTOCOL[dns_pb2.socketProtocol]
-
-    dns_msg["from_address"] = "0.0.0.0"
-    from_addr = getattr(dns_pb2, "from")
-    if len(from_addr):
-        if dns_pb2.socketFamily == PBDNSMessage.SocketFamily.INET:
-            dns_msg["from_address"] = socket.inet_ntop(socket.AF_INET, from_addr)
-        if dns_pb2.socketFamily == PBDNSMessage.SocketFamily.INET6:
-            dns_msg["from_address"] = socket.inet_ntop(socket.AF_INET6, from_addr)
-
-    dns_msg["to_address"] = "0.0.0.0"
-    to_addr = getattr(dns_pb2, "to")
-    if len(to_addr):
-        if dns_pb2.socketFamily == PBDNSMessage.SocketFamily.INET:
-            dns_msg["to_address"] = socket.inet_ntop(socket.AF_INET, to_addr)
-        if dns_pb2.socketFamily == PBDNSMessage.SocketFamily.INET6:
-            dns_msg["to_address"] = socket.inet_ntop(socket.AF_INET6, to_addr)
-
-    time_req = 0
-    time_rsp = 0
-    time_latency = 0
-
-    if dns_pb2.type in [
-        PBDNSMessage.Type.DNSQueryType,
-        PBDNSMessage.Type.DNSOutgoingQueryType,
-    ]:
-        utime_req = "%s" % dns_pb2.timeUsec
-        time_req = "%s.%s" % (dns_pb2.timeSec, utime_req.zfill(6))
-
-    if dns_pb2.type in [
-        PBDNSMessage.Type.DNSResponseType,
-        PBDNSMessage.Type.DNSIncomingResponseType,
-    ]:
-        utime_rsp = "%s" % dns_pb2.timeUsec
-        time_rsp = "%s.%s" % (dns_pb2.timeSec, utime_rsp.zfill(6))
-
-        utime_req = "%s" % dns_pb2.response.queryTimeUsec
-        time_req = "%s.%s" % (dns_pb2.response.queryTimeSec, utime_req.zfill(6))
-
-        time_latency = round(float(time_rsp) - float(time_req), 6)
-
-    dns_msg["query_time"] = datetime.fromtimestamp(
-        float(time_req), tz=timezone.utc
-    ).isoformat()
-    dns_msg["response_time"] = datetime.fromtimestamp(
-        float(time_rsp), tz=timezone.utc
-    ).isoformat()
-
-    dns_msg["latency"] = time_latency
-
-    dns_msg["query_type"] = dns.rdatatype.to_text(dns_pb2.question.qType)
-    dns_msg["query_name"] = dns_pb2.question.qName
-
-    if dns_pb2.response.rcode == 65536:
-        dns_msg["return_code"] = "NETWORK_ERROR"
-    else:
-        dns_msg["return_code"] = dns.rcode.to_text(dns_pb2.response.rcode)
-    dns_msg["bytes"] = dns_pb2.inBytes
+    cb_onrecord(record.from_pb(dns_pb2, listener), tcp_writer, outputs, loop)
 
-    dns_json = json.dumps(dns_msg)
 
-    if debug_mode:
-        logging.info(dns_json)
+def cb_onrecord(dns_record, tcp_writer, outputs, loop, after=None):
+    """run the stages, or the ones following the stage <after>, then the outputs"""
+    stages = outputs["stage"]
+    if after is not None:
+        stages = stages[stages.index(after) + 1 :] if after in stages else []
 
-    else:
+    # stages may enrich the record, or drop it by returning None
+    for stage in stages:
+        dns_record = stage.process(dns_record)
+        if dns_record is None:
+            return
+
+    # outputs working on the records
+    for output in outputs["record"]:
+        output.write(dns_record)
+
+    if tcp_writer is None and not outputs["json"]:
+        return
+
+    cb_onjson(record.to_json(dns_record), tcp_writer, outputs, loop)
+
+
+def cb_onjson(dns_json, tcp_writer, outputs, loop):
+    """write the json payload"""
+    for output in outputs["json"]:
+        output.write(dns_json)
+
+    if tcp_writer is not None:
         if tcp_writer.transport._conn_lost:
             # exit if we lost the connection with the remote collector
             loop.stop()
@@ -142,13 +331,54 @@ async def cb_onpayload(dns_pb2, payload, tcp_writer, debug_mode, loop):
             tcp_writer.write(dns_json.encode() + b"\n")
 
 
-async def cb_onconnect(reader, writer, tcp_writer, debug_mode):
+def cb_onframe(dns_pb2, payload, tcp_writer, outputs, loop, listener, ts=None):
+    """on protobuf frame received at the time ts, return the server identity"""
+    # outputs working on the raw frame, with its arrival time in microseconds
+    if ts is not None:
+        ts = int(ts * 1000000)
+    for output in outputs["raw"]:
+        output.write(payload, ts)
+
+    # a batch of messages ?
+    if wire.is_message_list(payload):
+        payloads = wire.split_message_list(payload)
+    else:
+        payloads = [payload]
+
+    for payload in payloads:
+        cb_onpayload(dns_pb2, payload, tcp_writer, outputs, loop, listener)
+
+    return dns_pb2.serverIdentity
+
+
+async def cb_onconnect(reader, writer, scheduler, listener, data=b""):
     logging.debug("connect accepted")
 
-    loop = asyncio.get_event_loop()
+    peername = writer.get_extra_info("peername")
+    if peername:
+        peer = scheduler.register("%s:%s" % peername[:2], listener)
+    else:
+        peer = scheduler.register("unix", listener)
+
     protobuf_streamer = protobuf.ProtoBufHandler()
-    dns_pb2 = PBDNSMessage()
 
+    # bytes not processed by the previous process
+    if data:
+        protobuf_streamer.append(data=data)
+
+    peer.connection = (reader, writer, protobuf_streamer, asyncio.current_task())
+    try:
+        await cb_onframes(reader, scheduler, peer, protobuf_streamer)
+    except asyncio.CancelledError:
+        # stopped to pass the connection to a new process
+        pass
+    finally:
+        peer.connection = None
+        scheduler.unregister(peer)
+
+
+async def cb_onframes(reader, scheduler, peer, protobuf_streamer):
+    """read the frames of the connection until closed"""
     running = True
     while running:
         try:
@@ -156,98 +386,684 @@ async def cb_onconnect(reader, writer, tcp_writer, debug_mode):
                 # read data
                 data = await reader.read(protobuf_streamer.pending_nb_bytes())
                 if not data:
+                    running = False
                     break
 
                 # append data to the buffer
                 protobuf_streamer.append(data=data)
 
+            # connection closed by the remote peer
+            if not running:
+                logging.debug("connection closed")
+                break
+
             # dns message is complete so get the payload
             payload = protobuf_streamer.decode()
 
-            # create a task to decode it
-            loop.create_task(
-                cb_onpayload(dns_pb2, payload, tcp_writer, debug_mode, loop)
-            )
+            # queue it, the scheduler serves the peers in turn
+            await scheduler.push(peer, payload)
 
         except Exception as e:
             running = False
             logging.error("something happened: %s" % e)
 
 
-async def handle_remoteclient(host, port):
+async def cb_peerstats(scheduler, interval, emit):
+    """emit the statistics per peer periodically"""
+    while True:
+        await asyncio.sleep(interval)
+        peers = scheduler.summary()
+        if peers:
+            emit(json.dumps({"dns_message": "PEERS", "peers": peers}))
+
+
+async def cb_flush(outputs, interval):
+    """flush the outputs periodically"""
+    while True:
+        await asyncio.sleep(interval)
+        for output in outputs["raw"] + outputs["stage"] + outputs["json"] + outputs["record"]:
+            output.flush()
+
+
+def remove_stale_socket(path):
+    """remove the socket file left by a previous run, refuse any other file"""
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError("%s exists and is not a socket" % path)
+
+    # a socket nobody listens on any more refuses the connection
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(1.0)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        if e.errno != errno.ECONNREFUSED:
+            raise ValueError("%s is not a stale socket - %s" % (path, e))
+        os.unlink(path)
+        return
+    finally:
+        sock.close()
+    raise ValueError("%s is in use by another process" % path)
+
+
+async def start_listener(listener, scheduler, unix_mode, unix_group, socks=None):
+    """start the servers of the listener, on the sockets inherited if any"""
+    label, ip, port, path = listener
+
+    def cb_client(r, w):
+        return cb_onconnect(r, w, scheduler, label)
+
+    # listening sockets passed by the previous process
+    if socks:
+        servers = []
+        for sock in socks:
+            if path is not None:
+                servers.append(
+                    await asyncio.start_unix_server(
+                        cb_client, sock=sock, **handoff.UNIX_SERVER_OPTIONS
+                    )
+                )
+            else:
+                servers.append(await asyncio.start_server(cb_client, sock=sock))
+        logging.debug("server listening on %s, inherited" % (path or "%s:%s" % (ip, port)))
+        return servers
+
+    # asynchronous server socket
+    if path is not None:
+        # remove a stale socket file from a previous run
+        remove_stale_socket(path)
+
+        server = await asyncio.start_unix_server(
+            cb_client, path=path, **handoff.UNIX_SERVER_OPTIONS
+        )
+
+        # let the senders sharing the host connect to the socket
+        os.chmod(path, unix_mode)
+        if unix_group is not None:
+            shutil.chown(path, group=unix_group)
+
+    else:
+        server = await asyncio.start_server(cb_client, host=ip, port=port)
+
+        for sock in server.sockets:
+            # force to use tcp keepalive
+            # It activates after 1 second (TCP_KEEPIDLE,) of idleness,
+            # then sends a keepalive ping once every 3 seconds (TCP_KEEPINTVL),
+            # and closes the connection after 10 failed ping (TCP_KEEPCNT)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 10)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 30)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 5)
+
+    logging.debug("server listening on %s" % (path or "%s:%s" % (ip, port)))
+    return [server]
+
+
+async def handle_remoteclient(host, port, path=None):
+    if path is not None:
+        logging.debug("Connecting to %s" % path)
+        tcp_reader, tcp_writer = await asyncio.open_unix_connection(path)
+        logging.debug("Connected to %s" % path)
+        return tcp_writer
+
     logging.debug("Connecting to %s %s" % (host, port))
     tcp_reader, tcp_writer = await asyncio.open_connection(host, int(port))
     logging.debug("Connected to %s %s" % (host, port))
     return tcp_writer
 
 
+def build_outputs(args, loop, tcp_writer, outputs, components):
+    """build the outputs of the configuration, return (outputs, components)
+
+    components maps the settings of each output to the output, the current
+    ones with unchanged settings are kept as they are, with their buffers and
+    caches, and the new ones are closed on error
+    """
+    new_outputs = {"raw": [], "stage": [], "json": [], "record": []}
+    new_components = {}
+
+    def emit_json(dns_json):
+        cb_onjson(dns_json, tcp_writer, outputs, loop)
+
+    def add(kind, spec, factory, error):
+        component = components.get(spec)
+        if component is None:
+            try:
+                component = factory()
+            except Exception as e:
+                raise Exception("%s - %s" % (error, e))
+        new_components[spec] = component
+        new_outputs[kind].append(component)
+
+    def new_dedup():
+        dedup = Dedup(
+            emit=lambda r: cb_onrecord(r, tcp_writer, outputs, loop, after=dedup),
+            window=args.dedup,
+            max_entries=args.dedup_entries,
+        )
+        return dedup
+
+    def new_relay():
+        raise Exception("can not be changed without restart")
+
+    try:
+        # drop the excluded records first
+        if args.exclude or args.sampling < 1.0:
+            add(
+                "stage",
+                ("filter", tuple(args.exclude or ()), args.sampling),
+                lambda: FilterStage(args.exclude or (), args.sampling),
+                "bad filters",
+            )
+
+        # collapse the repeated records, the next stages see them once
+        if args.dedup is not None:
+            add(
+                "stage",
+                ("dedup", args.dedup, args.dedup_entries),
+                new_dedup,
+                "bad dedup settings",
+            )
+
+        # enrich the records ?
+        if args.geo_db is not None:
+            add(
+                "stage",
+                ("geo", args.geo_db, args.geo_cache),
+                lambda: GeoEnrichment(args.geo_db, cache_size=args.geo_cache),
+                "unable to load the geo database %s" % args.geo_db,
+            )
+
+        if args.psl is not None:
+            add(
+                "stage",
+                ("psl", args.psl, args.psl_cache),
+                lambda: DomainEnrichment(args.psl, cache_size=args.psl_cache),
+                "unable to load the public suffix list %s" % args.psl,
+            )
+
+        # capture raw frames ?
+        if args.c is not None:
+            add(
+                "raw",
+                ("capture", args.c, args.capture_size),
+                lambda: CaptureWriter(args.c, max_size=args.capture_size * 1024 * 1024),
+                "unable to capture to %s" % args.c,
+            )
+
+        # relay to another receiver ?
+        if args.relay is not None:
+            add("raw", ("relay", args.relay), new_relay, "unable to relay to %s" % args.relay)
+
+        # write to local files ?
+        if args.f is not None:
+            add(
+                "json",
+                (
+                    "file",
+                    args.f,
+                    args.file_rotate_interval,
+                    args.file_rotate_size,
+                    args.file_compress,
+                ),
+                lambda: FileOutput(
+                    args.f,
+                    rotate_interval=args.file_rotate_interval,
+                    rotate_size=args.file_rotate_size * 1024 * 1024,
+                    compress=args.file_compress,
+                ),
+                "unable to write files to %s" % args.f,
+            )
+
+        # print json payloads to stdout when no other output is used
+        if not (args.j or args.f or args.columnar or args.relay):
+            add("json", ("stdout",), lambda: StdoutOutput(loop), "unable to write to stdout")
+
+        # write columnar batches ?
+        if args.columnar is not None:
+            add(
+                "record",
+                ("columnar", args.columnar, args.columnar_batch),
+                lambda: ColumnarOutput(args.columnar, batch_size=args.columnar_batch),
+                "unable to write columnar batches to %s" % args.columnar,
+            )
+
+        # compute statistics per time window ?
+        if args.stats is not None:
+            add(
+                "record",
+                ("stats", args.stats),
+                lambda: WindowStats(args.stats, emit=emit_json),
+                "unable to compute statistics",
+            )
+
+        # detect tunneling and dga signals ?
+        if args.detect:
+            add(
+                "record",
+                ("detect", args.detect_window, args.detect_clients),
+                lambda: TunnelDetection(
+                    emit=emit_json,
+                    window=args.detect_window,
+                    max_clients=args.detect_clients,
+                ),
+                "bad detection settings",
+            )
+    except Exception:
+        for spec, component in new_components.items():
+            if components.get(spec) is not component:
+                component.close()
+        raise
+
+    return new_outputs, new_components
+
+
+async def cb_reload(state, loop, tcp_writer, outputs, scheduler):
+    """reload the configuration, swap the outputs and the listeners which changed"""
+    async with state["lock"]:
+        args = state["args"]
+        components = state["components"]
+        servers = state["servers"]
+
+        try:
+            new_args = parse_args()
+            listeners = parse_listeners(new_args)
+        except SystemExit:
+            # the parser has written the error
+            logging.error("unable to reload the configuration - invalid option")
+            return
+        except Exception as e:
+            logging.error("unable to reload the configuration - %s", e)
+            return
+
+        for name in CONFIG_STATIC:
+            if getattr(new_args, name) != getattr(args, name):
+                logging.warning("option %s can not be changed without restart", name)
+                setattr(new_args, name, getattr(args, name))
+
+        try:
+            new_outputs, new_components = build_outputs(
+                new_args, loop, tcp_writer, outputs, components
+            )
+        except Exception as e:
+            logging.error("unable to reload the configuration - %s", e)
+            return
+
+        added = [c for k, c in new_components.items() if components.get(k) is not c]
+        removed = [c for k, c in components.items() if new_components.get(k) is not c]
+
+        # start the new listeners before changing anything
+        new_servers = {}
+        try:
+            for listener in listeners:
+                if listener not in servers:
+                    new_servers[listener] = await start_listener(
+                        listener, scheduler, int(args.unix_mode, 8), args.unix_group
+                    )
+        except Exception as e:
+            logging.error("unable to reload the configuration - unable to listen - %s", e)
+            for server_list in new_servers.values():
+                for server in server_list:
+                    server.close()
+            for component in added:
+                component.close()
+            return
+
+        # the removed stages may still pass held records to the current outputs
+        for component in removed:
+            if component in outputs["stage"]:
+                component.close()
+
+        # swap in place, the outputs which are not components (tail) are kept
+        managed = set(id(c) for c in components.values())
+        for kind, new_list in new_outputs.items():
+            others = [o for o in outputs[kind] if id(o) not in managed]
+            outputs[kind][:] = new_list + others
+
+        for component in removed:
+            if component not in new_outputs["stage"]:
+                component.close()
+
+        # stop the removed listeners, the connections accepted are kept
+        for listener in list(servers):
+            if listener not in listeners:
+                for server in servers.pop(listener):
+                    server.close()
+                path = listener[3]
+                if path is not None and os.path.exists(path):
+                    os.unlink(path)
+        servers.update(new_servers)
+
+        state["args"] = new_args
+        state["components"] = new_components
+        logging.info(
+            "configuration reloaded: %s outputs added, %s removed, %s listeners added",
+            len(added),
+            len(removed),
+            len(new_servers),
+        )
+
+
+async def cb_handoff(state, loop, scheduler):
+    """pass the sockets to a new process, then stop once drained"""
+    async with state["lock"]:
+        if state["channel"] is not None:
+            return
+
+        if not handoff.supported():
+            logging.error(
+                "unable to restart - python %s or later is required",
+                ".".join(str(v) for v in handoff.HANDOFF_MIN_VERSION),
+            )
+            return
+
+        channel, new_channel = handoff.channel_pair()
+        try:
+            process = handoff.spawn(new_channel)
+        except Exception as e:
+            logging.error("unable to restart - %s", e)
+            channel.close()
+            return
+        finally:
+            new_channel.close()
+
+        # the new process accepts the connections but waits to process them
+        tail_sock = None
+        if state["tail"] is not None:
+            tail_sock = state["tail"].server.sockets[0]
+        nb_sockets = handoff.send_listeners(channel, state["servers"], tail_sock)
+        channel.setblocking(False)
+        try:
+            ready = await asyncio.wait_for(
+                loop.sock_recv(channel, 16), handoff.HANDOFF_TIMEOUT
+            )
+        except (asyncio.TimeoutError, OSError):
+            ready = b""
+        if ready != b"ready":
+            logging.error("unable to restart - the new process is not ready")
+            process.kill()
+            process.wait()
+            channel.close()
+            return
+        state["channel"] = channel
+
+        if state["tail"] is not None:
+            state["tail"].detach()
+        for server_list in state["servers"].values():
+            for server in server_list:
+                server.close()
+
+        # stop reading, then process the frames already read
+        connections = []
+        for peer in list(scheduler.peers):
+            if peer.connection is not None:
+                connections.append((peer, peer.connection))
+                peer.connection[1].transport.pause_reading()
+                peer.connection[3].cancel()
+        await asyncio.gather(*[c[3] for p, c in connections], return_exceptions=True)
+        scheduler.drain()
+
+        # pass the connections with the bytes not processed yet
+        channel.setblocking(True)
+        for peer, (reader, writer, streamer, task) in connections:
+            sock = writer.get_extra_info("socket")
+            if not reader.at_eof() and sock is not None:
+                handoff.send_message(
+                    channel,
+                    {"listener": peer.listener},
+                    [sock.fileno()],
+                    handoff.unprocessed(reader, streamer),
+                )
+            writer.close()
+
+        logging.info(
+            "restart: %s listening sockets and %s connections passed to process %s",
+            nb_sockets,
+            len(connections),
+            process.pid,
+        )
+
+        # the new process starts to process the frames once the channel is closed
+        loop.stop()
+
+
+async def cb_shutdown(outputs, tail, tcp_writer):
+    """close the outputs, then wait for the connections to send their buffers"""
+    writers = []
+
+    # record outputs may still emit json payloads when closed
+    for output in outputs["raw"] + outputs["stage"] + outputs["record"] + outputs["json"]:
+        output.close()
+        if isinstance(output, RelayOutput):
+            writers.append(output.tcp_writer)
+
+    if tail is not None:
+        tail.close()
+
+    if tcp_writer is not None:
+        tcp_writer.close()
+        writers.append(tcp_writer)
+
+    # a closed transport still writes its buffer before the connection is lost
+    for writer in writers:
+        try:
+            await asyncio.wait_for(writer.wait_closed(), SHUTDOWN_TIMEOUT)
+        except Exception as e:
+            logging.error("unable to send the pending payloads - %s", e)
+    logging.debug("connection done")
+
+
+def cb_onhandoff(channel, loop, scheduler):
+    """adopt the connections passed by the previous process, serve once it is gone"""
+    try:
+        message = handoff.recv_message(channel)
+    except BlockingIOError:
+        return
+    except OSError:
+        message = None
+
+    if message is None:
+        loop.remove_reader(channel.fileno())
+        channel.close()
+        logging.debug("previous process stopped, serving the connections")
+        loop.create_task(scheduler.run())
+        return
+
+    header, fds, data = message
+    for fd in fds:
+        loop.create_task(cb_adopt(fd, data, header["listener"], scheduler))
+
+
+async def cb_adopt(fd, data, listener, scheduler):
+    """serve a connection passed by the previous process"""
+    sock = socket.socket(fileno=fd)
+    if sock.family == socket.AF_UNIX:
+        reader, writer = await asyncio.open_unix_connection(sock=sock)
+    else:
+        reader, writer = await asyncio.open_connection(sock=sock)
+    await cb_onconnect(reader, writer, scheduler, listener, data)
+
+
 def start_receiver():
     """start dnstap receiver"""
-    # parse arguments
-    args = parser.parse_args()
+    # parse arguments, the configuration file is read again on SIGHUP
+    try:
+        args = parse_args()
+    except Exception as e:
+        parser.error("unable to load the configuration - %s" % e)
 
-    # configure logs
+    # configure logs, stdout is kept for the json payloads
     level = logging.INFO
     if args.v:
         level = logging.DEBUG
     logging.basicConfig(
-        format="%(asctime)s %(message)s", stream=sys.stdout, level=level
+        format="%(asctime)s %(message)s", stream=sys.stderr, level=level
     )
 
     logging.debug("Start pdns protobuf receiver...")
 
+    # restarted by a running receiver ?
+    channel = handoff.inherited_channel()
+    inherited = {}
+    tail_sock = None
+    if channel is not None:
+        try:
+            inherited, tail_sock = handoff.recv_listeners(channel)
+        except Exception as e:
+            logging.error("unable to restart - %s", e)
+            sys.exit(1)
+
+    if args.fast_parser:
+        message_class = wire.WireMessage
+    else:
+        message_class = PBDNSMessage
+    logging.info(
+        "protobuf backend: %s, fast parser %s",
+        wire.backend(),
+        "enabled" if args.fast_parser else "disabled",
+    )
+
+    try:
+        listeners = parse_listeners(args)
+    except ValueError as e:
+        logging.error("%s", e)
+        sys.exit(1)
+
     try:
-        listen_ip, listen_port = args.l.split(":")
+        unix_mode = int(args.unix_mode, 8)
     except Exception as e:
-        logging.error("bad listen ip:port provided - %s", args.l)
+        logging.error("bad unix socket mode provided - %s", args.unix_mode)
         sys.exit(1)
 
-    if args.j is None:
-        debug_mode = True
-        remote_host = None
-        remote_port = None
-    else:
-        debug_mode = False
+    if args.j is not None:
         try:
-            remote_host, remote_port = args.j.split(":")
+            remote = parse_address(args.j)
         except Exception as e:
             logging.error("bad remote ip:port provided -%s", args.j)
             sys.exit(1)
 
-    # run until complete
     loop = asyncio.get_event_loop()
 
     # create connection to the remote json collector ?
-    if not debug_mode:
-        task = loop.create_task(handle_remoteclient(remote_host, remote_port))
+    if args.j is not None:
+        task = loop.create_task(handle_remoteclient(*remote))
         loop.run_until_complete(task)
         tcp_writer = task.result()
     else:
         tcp_writer = None
 
-    # asynchronous server socket
-    socket_server = asyncio.start_server(
-        lambda r, w: cb_onconnect(r, w, tcp_writer, debug_mode),
-        host=listen_ip,
-        port=listen_port,
+    # outputs are built from their settings, the relay is only connected at startup
+    components = {}
+    if args.relay is not None:
+        try:
+            relay = parse_address(args.relay)
+        except Exception as e:
+            logging.error("bad relay ip:port provided - %s", args.relay)
+            sys.exit(1)
+        task = loop.create_task(handle_remoteclient(*relay))
+        loop.run_until_complete(task)
+        components[("relay", args.relay)] = RelayOutput(task.result(), loop)
+
+    outputs = {"raw": [], "stage": [], "json": [], "record": []}
+    try:
+        new_outputs, components = build_outputs(args, loop, tcp_writer, outputs, components)
+    except Exception as e:
+        logging.error("%s", e)
+        sys.exit(1)
+    for kind, new_list in new_outputs.items():
+        outputs[kind].extend(new_list)
+
+    # serve the connections in turn, with one decoder for all
+    dns_pb2 = message_class()
+    scheduler = Scheduler(
+        lambda peer, payload, ts: cb_onframe(
+            dns_pb2, payload, tcp_writer, outputs, loop, peer.listener, ts
+        ),
+        budget_frames=args.budget_frames,
+        budget_bytes=args.budget_bytes,
+        keep_closed=args.stats is not None,
     )
 
-    # run until complete
-    abstract_server = loop.run_until_complete(socket_server)
+    if args.stats is not None:
+        loop.create_task(
+            cb_peerstats(
+                scheduler, args.stats, lambda j: cb_onjson(j, tcp_writer, outputs, loop)
+            )
+        )
+
+    # asynchronous server sockets, sharing the outputs
+    servers = {}
+    for listener in listeners:
+        try:
+            servers[listener] = loop.run_until_complete(
+                start_listener(
+                    listener,
+                    scheduler,
+                    unix_mode,
+                    args.unix_group,
+                    socks=inherited.pop(listener, None),
+                )
+            )
+        except Exception as e:
+            logging.error("unable to listen - %s", e)
+            sys.exit(1)
+
+    # inherited listening sockets no more configured
+    for socks in inherited.values():
+        for sock in socks:
+            sock.close()
+
+    # live tail of the records, only an output while subscribed
+    tail = None
+    if args.tail is not None:
+        tail = TailServer(outputs["record"], queue_size=args.tail_queue)
+        try:
+            ip, port, path = parse_address(args.tail)
+            if path is not None and tail_sock is None:
+                remove_stale_socket(path)
+            loop.run_until_complete(tail.start(ip, port, path, sock=tail_sock))
+        except Exception as e:
+            logging.error("unable to listen for tail subscribers - %s", e)
+            sys.exit(1)
+    elif tail_sock is not None:
+        tail_sock.close()
 
-    # set some tcp socket options
-    sock = abstract_server.sockets[0]
+    state = {
+        "args": args,
+        "components": components,
+        "servers": servers,
+        "lock": asyncio.Lock(),
+        "channel": None,
+        "tail": tail,
+    }
 
-    # force to use tcp keepalive
-    # It activates after 1 second (TCP_KEEPIDLE,) of idleness,
-    # then sends a keepalive ping once every 3 seconds (TCP_KEEPINTVL),
-    # and closes the connection after 10 failed ping (TCP_KEEPCNT)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 10)
-    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 30)
-    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 5)
+    # reload the configuration file on SIGHUP
+    if args.config is not None:
+        loop.add_signal_handler(
+            signal.SIGHUP,
+            lambda: loop.create_task(
+                cb_reload(state, loop, tcp_writer, outputs, scheduler)
+            ),
+        )
 
-    logging.debug("server listening")
+    # pass the sockets to a new process on SIGUSR2
+    loop.add_signal_handler(
+        signal.SIGUSR2, lambda: loop.create_task(cb_handoff(state, loop, scheduler))
+    )
+
+    # serve the connections, once the previous process is gone when restarted
+    if channel is not None:
+        channel.send(b"ready")
+        channel.setblocking(False)
+        loop.add_reader(channel.fileno(), cb_onhandoff, channel, loop, scheduler)
+    else:
+        loop.create_task(scheduler.run())
+
+    # flush buffered outputs even when idle
+    loop.create_task(cb_flush(outputs, 1.0))
 
     # run event loop
     try:
@@ -255,6 +1071,21 @@ def start_receiver():
     except KeyboardInterrupt:
         pass
 
-    if not debug_mode:
-        tcp_writer.close()
-        logging.debug("connection done")
+    # stop the connections and the periodic tasks, then serve the frames already read
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    scheduler.drain()
+
+    # the loop runs again to send the payloads buffered by the connections
+    loop.run_until_complete(cb_shutdown(outputs, tail, tcp_writer))
+
+    # the new process serves the connections once the outputs are closed
+    if state["channel"] is not None:
+        state["channel"].close()
+        return
+
+    for label, ip, port, path in servers:
+        if path is not None and os.path.exists(path):
+            os.unlink(path)
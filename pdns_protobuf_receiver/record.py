@@ -0,0 +1,254 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import socket
+import operator
+
+from datetime import datetime, timedelta, timezone
+from json.encoder import encode_basestring_ascii
+
+import dns.rdatatype
+import dns.rcode
+
+PBDNSMESSAGE_TYPE = {
+    1: "CLIENT_QUERY",
+    2: "CLIENT_RESPONSE",
+    3: "AUTH_QUERY",
+    4: "AUTH_RESPONSE",
+}
+PBDNSMESSAGE_SOCKETFAMILY = {1: "IPv4", 2: "IPv6"}
+
+PBDNSMESSAGE_SOCKETPROTOCOL = {1: "UDP", 2: "TCP"}
+
+# query types carrying the time of the query, response types the time of the
+# response and the time of the corresponding query
+QUERY_TYPES = (1, 3)
+RESPONSE_TYPES = (2, 4)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# fields of the record, in the order read by the encoders
+RECORD_FIELDS = (
+    "dns_message",
+    "socket_family",
+    "socket_protocol",
+    "from_address",
+    "to_address",
+    "query_time",
+    "response_time",
+    "query_type",
+    "query_name",
+    "return_code",
+    "bytes",
+    "listener",
+)
+
+RECORD_VALUES = operator.attrgetter(*RECORD_FIELDS)
+
+# optional fields set by the enrichment stages, encoded when not None
+RECORD_EXTRA_FIELDS = (
+    "from_asn",
+    "from_country",
+    "registered_domain",
+    "repeats",
+)
+
+# text representation caches, filled on first use
+QTYPE_TEXT = {}
+RCODE_TEXT = {65536: "NETWORK_ERROR"}
+
+
+class DnsRecord(object):
+    """decoded dns message, values are kept as found in the protobuf message
+
+    types and codes are integers, addresses raw bytes and times microseconds
+    since epoch, converted to text by the encoders only
+    """
+
+    __slots__ = RECORD_FIELDS + RECORD_EXTRA_FIELDS
+
+    def __init__(
+        self,
+        dns_message,
+        socket_family,
+        socket_protocol,
+        from_address,
+        to_address,
+        query_time,
+        response_time,
+        query_type,
+        query_name,
+        return_code,
+        bytes,
+        listener=None,
+    ):
+        """prepare the class"""
+        self.dns_message = dns_message
+        self.socket_family = socket_family
+        self.socket_protocol = socket_protocol
+        self.from_address = from_address
+        self.to_address = to_address
+        self.query_time = query_time
+        self.response_time = response_time
+        self.query_type = query_type
+        self.query_name = query_name
+        self.return_code = return_code
+        self.bytes = bytes
+        self.listener = listener
+        self.from_asn = None
+        self.from_country = None
+        self.registered_domain = None
+        self.repeats = None
+
+    @property
+    def latency(self):
+        """latency in microseconds, 0 for queries"""
+        if self.dns_message in RESPONSE_TYPES:
+            return self.response_time - self.query_time
+        return 0
+
+
+def from_pb(dns_pb2, listener=None):
+    """build the record from the decoded protobuf message"""
+    msg_type = dns_pb2.type
+    msg_time = dns_pb2.timeSec * 1000000 + dns_pb2.timeUsec
+
+    query_time = 0
+    response_time = 0
+    if msg_type in QUERY_TYPES:
+        query_time = msg_time
+    elif msg_type in RESPONSE_TYPES:
+        response_time = msg_time
+        response = dns_pb2.response
+        query_time = response.queryTimeSec * 1000000 + response.queryTimeUsec
+
+    question = dns_pb2.question
+    return DnsRecord(
+        msg_type,
+        dns_pb2.socketFamily,
+        dns_pb2.socketProtocol,
+        getattr(dns_pb2, "from"),
+        dns_pb2.to,
+        query_time,
+        response_time,
+        question.qType,
+        question.qName,
+        dns_pb2.response.rcode,
+        dns_pb2.inBytes,
+        listener,
+    )
+
+
+def address_to_text(family, addr):
+    """convert raw address bytes to text"""
+    if len(addr):
+        if family == 1:
+            return socket.inet_ntop(socket.AF_INET, addr)
+        if family == 2:
+            return socket.inet_ntop(socket.AF_INET6, addr)
+    return "0.0.0.0"
+
+
+def time_to_text(usec):
+    """convert microseconds since epoch to iso format"""
+    return (EPOCH + timedelta(microseconds=usec)).isoformat()
+
+
+def qtype_to_text(qtype):
+    """convert the query type to text"""
+    text = QTYPE_TEXT.get(qtype)
+    if text is None:
+        text = QTYPE_TEXT[qtype] = dns.rdatatype.to_text(qtype)
+    return text
+
+
+def rcode_to_text(rcode):
+    """convert the response code to text"""
+    text = RCODE_TEXT.get(rcode)
+    if text is None:
+        text = RCODE_TEXT[rcode] = dns.rcode.to_text(rcode)
+    return text
+
+
+def to_json(record):
+    """encode the record in json"""
+    (
+        msg_type,
+        family,
+        protocol,
+        from_addr,
+        to_addr,
+        query_time,
+        response_time,
+        qtype,
+        qname,
+        rcode,
+        nbytes,
+        listener,
+    ) = RECORD_VALUES(record)
+
+    if msg_type in RESPONSE_TYPES:
+        latency = round((response_time - query_time) / 1000000, 6)
+    else:
+        latency = 0
+
+    dns_json = (
+        '{"dns_message": "%s", "socket_family": "%s", "socket protocol": "%s", '
+        '"from_address": "%s", "to_address": "%s", "query_time": "%s", '
+        '"response_time": "%s", "latency": %r, "query_type": "%s", '
+        '"query_name": %s, "return_code": "%s", "bytes": %d'
+        % (
+            PBDNSMESSAGE_TYPE[msg_type],
+            PBDNSMESSAGE_SOCKETFAMILY[family],
+            PBDNSMESSAGE_SOCKETPROTOCOL[protocol],
+            address_to_text(family, from_addr),
+            address_to_text(family, to_addr),
+            time_to_text(query_time),
+            time_to_text(response_time),
+            latency,
+            qtype_to_text(qtype),
+            encode_basestring_ascii(qname),
+            rcode_to_text(rcode),
+            nbytes,
+        )
+    )
+
+    if listener is not None:
+        dns_json += ', "listener": %s' % encode_basestring_ascii(listener)
+
+    if record.from_asn is not None:
+        dns_json += ', "from_asn": %d, "from_country": %s' % (
+            record.from_asn,
+            encode_basestring_ascii(record.from_country),
+        )
+
+    if record.registered_domain is not None:
+        dns_json += ', "registered_domain": %s' % encode_basestring_ascii(
+            record.registered_domain
+        )
+
+    if record.repeats is not None:
+        dns_json += ', "repeats": %d' % record.repeats
+
+    return dns_json + "}"
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+import struct
+import logging
+
+from pdns_protobuf_receiver import wire
+
+# the frame length is encoded on 2 bytes
+FRAME_MAX_SIZE = 65535
+
+
+class RelayOutput(object):
+    def __init__(self, tcp_writer, loop, flush_interval=1.0):
+        """prepare the class"""
+        self.tcp_writer = tcp_writer
+        self.loop = loop
+        self.flush_interval = flush_interval
+
+        self.entries = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+
+    def write(self, payload, ts=None):
+        """add the raw protobuf frame to the current PBDNSMessageList"""
+        if wire.is_message_list(payload):
+            for msg in wire.split_message_list(payload):
+                self.append(msg)
+        else:
+            self.append(payload)
+
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.send()
+
+    def append(self, payload):
+        """add one protobuf message"""
+        entry = wire.encode_message_list_entry(payload)
+        if len(entry) > FRAME_MAX_SIZE:
+            logging.warning("relay: message too large, dropped")
+            return
+
+        if self.size + len(entry) > FRAME_MAX_SIZE:
+            self.send()
+
+        self.entries.append(entry)
+        self.size += len(entry)
+
+    def flush(self):
+        """send the pending messages"""
+        self.send()
+
+    def send(self):
+        """send the PBDNSMessageList frame"""
+        self.last_flush = time.monotonic()
+        if not self.entries:
+            return
+
+        if self.tcp_writer.transport.is_closing():
+            # exit if we lost the connection with the remote receiver
+            self.loop.stop()
+            raise Exception("connection lost with relay")
+
+        self.tcp_writer.write(struct.pack("!H", self.size) + b"".join(self.entries))
+        self.entries = []
+        self.size = 0
+
+    def close(self):
+        """send the pending messages and close the connection"""
+        if not self.tcp_writer.transport.is_closing():
+            self.send()
+        self.tcp_writer.close()
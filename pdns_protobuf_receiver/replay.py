@@ -0,0 +1,145 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import logging
+import socket
+import time
+import sys
+
+from pdns_protobuf_receiver.capture import CaptureReader
+from pdns_protobuf_receiver.receiver import parse_address
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-r", required=True, help="read the capture from the directory <path>")
+parser.add_argument(
+    "-d",
+    default="127.0.0.1:50001",
+    help="send protobuf dns message to tcp/ip address <ip:port> or unix:<path>",
+)
+parser.add_argument(
+    "-s",
+    type=float,
+    default=1.0,
+    help="replay speed factor, 1 for original speed, 0 for as fast as possible",
+)
+parser.add_argument("-v", action="store_true", help="verbose mode")
+
+# frames are grouped before sending when replaying as fast as possible
+REPLAY_BATCH_SIZE = 64 * 1024
+
+
+def replay(reader, sock, speed):
+    """send the captured frames to the socket, return the number of frames"""
+    nb_frames = 0
+    batch = []
+    batch_size = 0
+
+    start_ts = None
+    start_time = None
+
+    for ts, frame in reader.frames():
+        if start_ts is None:
+            start_ts = ts
+            start_time = time.monotonic()
+
+        if speed > 0:
+            delay = start_time + (ts - start_ts) / 1000000 / speed - time.monotonic()
+            if delay > 0:
+                if batch:
+                    sock.sendall(b"".join(batch))
+                    batch = []
+                    batch_size = 0
+                time.sleep(delay)
+
+        batch.append(frame)
+        batch_size += len(frame)
+        nb_frames += 1
+
+        if batch_size >= REPLAY_BATCH_SIZE:
+            sock.sendall(b"".join(batch))
+            batch = []
+            batch_size = 0
+
+    if batch:
+        sock.sendall(b"".join(batch))
+
+    return nb_frames
+
+
+def connect(host, port, path=None):
+    """connect to the receiver, return the socket"""
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+    return socket.create_connection((host, port))
+
+
+def start_replay():
+    """start capture replay"""
+    # parse arguments
+    args = parser.parse_args()
+
+    # configure logs
+    level = logging.INFO
+    if args.v:
+        level = logging.DEBUG
+    logging.basicConfig(
+        format="%(asctime)s %(message)s", stream=sys.stdout, level=level
+    )
+
+    try:
+        remote_host, remote_port, remote_path = parse_address(args.d)
+    except Exception as e:
+        logging.error("bad remote ip:port or unix:<path> provided - %s", args.d)
+        sys.exit(1)
+
+    if args.s < 0:
+        logging.error("bad speed factor provided - %s", args.s)
+        sys.exit(1)
+
+    reader = CaptureReader(args.r)
+
+    remote = remote_path or "%s %s" % (remote_host, remote_port)
+    logging.debug("Connecting to %s" % remote)
+    sock = connect(remote_host, remote_port, remote_path)
+    logging.debug("Connected to %s" % remote)
+
+    start = time.monotonic()
+    try:
+        nb_frames = replay(reader, sock, args.s)
+    except KeyboardInterrupt:
+        nb_frames = None
+    finally:
+        sock.close()
+
+    if nb_frames is not None:
+        logging.info(
+            "%s frames replayed in %.3f seconds" % (nb_frames, time.monotonic() - start)
+        )
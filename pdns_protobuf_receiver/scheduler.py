@@ -0,0 +1,192 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+import asyncio
+import logging
+
+from collections import deque
+
+
+class Peer(object):
+    def __init__(self, address, listener):
+        """prepare the class"""
+        self.address = address
+        self.listener = listener
+        self.closed = False
+
+        # pending frames as (monotonic arrival time, wall clock arrival time, payload)
+        self.frames = deque()
+
+        # set when the reader can queue more frames
+        self.writable = asyncio.Event()
+        self.writable.set()
+
+        # server identity -> [frames, bytes, lag sum, lag max]
+        self.stats = {}
+
+        # (reader, writer, streamer, task) of the connection, for the restart
+        self.connection = None
+
+    def summary(self):
+        """return the statistics of the peer per server identity"""
+        peers = []
+        for identity, (nb_frames, nb_bytes, lag_sum, lag_max) in self.stats.items():
+            peers.append(
+                {
+                    "peer": self.address,
+                    "listener": self.listener,
+                    "server_identity": identity.decode(errors="replace"),
+                    "frames": nb_frames,
+                    "bytes": nb_bytes,
+                    "lag_mean": round(lag_sum / nb_frames, 6) if nb_frames else 0,
+                    "lag_max": round(lag_max, 6),
+                    "pending": len(self.frames),
+                }
+            )
+        return peers
+
+
+class Scheduler(object):
+    def __init__(
+        self,
+        process,
+        budget_frames=64,
+        budget_bytes=64 * 1024,
+        max_pending=4096,
+        keep_closed=False,
+    ):
+        """prepare the class
+
+        process(peer, payload, ts) handles one frame received at the time ts
+        and returns the server identity
+        """
+        self.process = process
+        self.budget_frames = budget_frames
+        self.budget_bytes = budget_bytes
+        self.max_pending = max_pending
+        self.keep_closed = keep_closed
+
+        # peers with pending frames, in round robin order
+        self.ready = deque()
+        self.wakeup = asyncio.Event()
+
+        self.peers = set()
+        self.closed = []
+
+    def register(self, address, listener=None):
+        """add a new peer"""
+        peer = Peer(address, listener)
+        self.peers.add(peer)
+        return peer
+
+    def unregister(self, peer):
+        """the peer is gone, its pending frames are still served"""
+        peer.closed = True
+        if not peer.frames:
+            self.remove(peer)
+
+    def remove(self, peer):
+        """forget the peer, keep its statistics until reported"""
+        self.peers.discard(peer)
+        if self.keep_closed:
+            self.closed.append(peer)
+
+    async def push(self, peer, payload):
+        """queue a frame of the peer, wait when too many frames are pending"""
+        if not peer.frames:
+            self.ready.append(peer)
+            self.wakeup.set()
+        peer.frames.append((time.monotonic(), time.time(), payload))
+
+        # backpressure on the busy peer only
+        if len(peer.frames) >= self.max_pending:
+            peer.writable.clear()
+            await peer.writable.wait()
+
+    def serve(self, peer):
+        """process the pending frames of the peer within the budget"""
+        now = time.monotonic()
+        nb_frames = 0
+        nb_bytes = 0
+        while peer.frames and nb_frames < self.budget_frames and nb_bytes < self.budget_bytes:
+            arrival, ts, payload = peer.frames.popleft()
+            nb_frames += 1
+            nb_bytes += len(payload)
+
+            try:
+                identity = self.process(peer, payload, ts)
+            except Exception as e:
+                logging.error("something happened: %s" % e)
+                continue
+
+            lag = now - arrival
+            stats = peer.stats.get(identity)
+            if stats is None:
+                stats = peer.stats[identity] = [0, 0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += len(payload)
+            stats[2] += lag
+            if lag > stats[3]:
+                stats[3] = lag
+
+        if len(peer.frames) <= self.max_pending // 2:
+            peer.writable.set()
+
+    def run_round(self):
+        """serve each peer with pending frames once"""
+        for _ in range(len(self.ready)):
+            peer = self.ready.popleft()
+            self.serve(peer)
+            if peer.frames:
+                self.ready.append(peer)
+            elif peer.closed:
+                self.remove(peer)
+
+    def drain(self):
+        """serve all the pending frames, without waiting"""
+        while self.ready:
+            self.run_round()
+
+    async def run(self):
+        """serve the peers round robin"""
+        while True:
+            if not self.ready:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            self.run_round()
+
+            # let the readers queue more frames
+            await asyncio.sleep(0)
+
+    def summary(self):
+        """return the statistics per peer and server identity, then reset them"""
+        peers = []
+        for peer in list(self.peers) + self.closed:
+            peers.extend(peer.summary())
+            peer.stats = {}
+        self.closed = []
+        return peers
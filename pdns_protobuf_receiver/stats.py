@@ -0,0 +1,197 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import time
+
+from array import array
+from datetime import datetime, timezone
+
+from pdns_protobuf_receiver.record import (
+    RECORD_VALUES,
+    RESPONSE_TYPES,
+    PBDNSMESSAGE_SOCKETFAMILY,
+    PBDNSMESSAGE_SOCKETPROTOCOL,
+    qtype_to_text,
+    rcode_to_text,
+)
+
+# imported on first use, it is slow to load
+numpy = None
+
+
+def import_numpy():
+    """import numpy, return None when not installed"""
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError:
+            return None
+        numpy = module
+    return numpy
+
+STATS_PERCENTILES = (50, 90, 99)
+
+def group_by(values, to_text, weights=None):
+    """count (or sum the weights) per distinct value"""
+    if weights is None:
+        keys, counts = numpy.unique(values, return_counts=True)
+    else:
+        keys, inverse = numpy.unique(values, return_inverse=True)
+        counts = numpy.bincount(inverse, weights=weights)
+    return dict((to_text(int(k)), int(c)) for k, c in zip(keys, counts))
+
+
+class WindowStats(object):
+    def __init__(self, interval, emit):
+        """prepare the class"""
+        if import_numpy() is None:
+            raise Exception("statistics require the numpy package")
+
+        self.interval = interval
+        self.emit = emit
+        self.new_window()
+
+    def new_window(self):
+        """reset the buffers"""
+        self.start = time.time()
+        self.types = array("B")
+        self.families = array("B")
+        self.protocols = array("B")
+        self.qtypes = array("H")
+        self.rcodes = array("I")
+        self.nbytes = array("Q")
+        self.latencies = array("q")
+        self.listeners = array("H")
+        self.labels = {}
+
+    def write(self, dns_record):
+        """buffer the numeric fields of the record"""
+        (
+            msg_type,
+            family,
+            protocol,
+            from_addr,
+            to_addr,
+            query_time,
+            response_time,
+            qtype,
+            qname,
+            rcode,
+            nbytes,
+            listener,
+        ) = RECORD_VALUES(dns_record)
+
+        label = self.labels.get(listener)
+        if label is None:
+            label = self.labels[listener] = len(self.labels)
+        self.listeners.append(label)
+
+        self.types.append(msg_type)
+        self.families.append(family)
+        self.protocols.append(protocol)
+        self.qtypes.append(qtype)
+        self.rcodes.append(rcode)
+        self.nbytes.append(nbytes)
+        if msg_type in RESPONSE_TYPES:
+            self.latencies.append(response_time - query_time)
+        else:
+            self.latencies.append(0)
+
+    def flush(self):
+        """close the window when the interval is elapsed"""
+        if time.time() - self.start >= self.interval:
+            self.close_window()
+
+    def close(self):
+        """close the current window"""
+        self.close_window()
+
+    def close_window(self):
+        """compute the summary record of the window and emit it"""
+        summary = self.summary(time.time())
+        self.new_window()
+        if summary is not None:
+            self.emit(json.dumps(summary))
+
+    def summary(self, end):
+        """compute the statistics with vectorized operations"""
+        nb_messages = len(self.types)
+        if not nb_messages:
+            return None
+
+        types = numpy.frombuffer(self.types, dtype=numpy.uint8)
+        rcodes = numpy.frombuffer(self.rcodes, dtype=numpy.uint32)
+        qtypes = numpy.frombuffer(self.qtypes, dtype=numpy.uint16)
+        nbytes = numpy.frombuffer(self.nbytes, dtype=numpy.uint64)
+        latencies = numpy.frombuffer(self.latencies, dtype=numpy.int64)
+
+        responses = numpy.isin(types, RESPONSE_TYPES)
+        nb_responses = int(numpy.count_nonzero(responses))
+
+        stats = {}
+        stats["dns_message"] = "STATISTICS"
+        stats["window_start"] = datetime.fromtimestamp(self.start, tz=timezone.utc).isoformat()
+        stats["window_end"] = datetime.fromtimestamp(end, tz=timezone.utc).isoformat()
+        stats["messages"] = nb_messages
+        stats["rate"] = round(nb_messages / max(end - self.start, 1e-6), 3)
+        stats["queries"] = nb_messages - nb_responses
+        stats["responses"] = nb_responses
+        stats["bytes"] = int(nbytes.sum())
+
+        stats["latency"] = {}
+        if nb_responses:
+            resp_latencies = latencies[responses]
+            values = numpy.percentile(resp_latencies, STATS_PERCENTILES)
+            for p, v in zip(STATS_PERCENTILES, values):
+                stats["latency"]["p%s" % p] = round(float(v) / 1000000, 6)
+            stats["latency"]["mean"] = round(float(resp_latencies.mean()) / 1000000, 6)
+            stats["latency"]["max"] = round(float(resp_latencies.max()) / 1000000, 6)
+
+            rcodes_count = group_by(rcodes[responses], rcode_to_text)
+            stats["return_codes"] = dict(
+                (k, round(v / nb_responses, 6)) for k, v in rcodes_count.items()
+            )
+        else:
+            stats["return_codes"] = {}
+
+        stats["query_types"] = group_by(qtypes, qtype_to_text)
+        stats["query_types_bytes"] = group_by(qtypes, qtype_to_text, weights=nbytes)
+        stats["socket_family"] = group_by(
+            numpy.frombuffer(self.families, dtype=numpy.uint8),
+            lambda v: PBDNSMESSAGE_SOCKETFAMILY.get(v, str(v)),
+        )
+        stats["socket_protocol"] = group_by(
+            numpy.frombuffer(self.protocols, dtype=numpy.uint8),
+            lambda v: PBDNSMESSAGE_SOCKETPROTOCOL.get(v, str(v)),
+        )
+
+        if len(self.labels) > 1 or None not in self.labels:
+            names = dict((v, k) for k, v in self.labels.items())
+            stats["listeners"] = group_by(
+                numpy.frombuffer(self.listeners, dtype=numpy.uint16),
+                lambda v: names[v] or "",
+            )
+        return stats
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import time
+import logging
+
+
+class StdoutOutput(object):
+    def __init__(self, loop, stream=None, buffer_size=64 * 1024, flush_interval=1.0):
+        """prepare the class"""
+        if stream is None:
+            stream = sys.stdout.buffer
+
+        self.loop = loop
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+
+        self.lines = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+        self.broken = False
+
+    def write(self, dns_json):
+        """add the json payload to the buffer"""
+        if self.broken:
+            return
+
+        line = dns_json.encode() + b"\n"
+        self.lines.append(line)
+        self.size += len(line)
+
+        if self.size >= self.buffer_size:
+            self.flush()
+        elif time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """write the buffered lines in one call"""
+        self.last_flush = time.monotonic()
+        if not self.lines or self.broken:
+            return
+
+        data = b"".join(self.lines)
+        self.lines = []
+        self.size = 0
+
+        try:
+            self.stream.write(data)
+            self.stream.flush()
+        except BrokenPipeError:
+            self.on_broken_pipe()
+
+    def on_broken_pipe(self):
+        """the reader is gone, stop the receiver"""
+        self.broken = True
+        logging.error("stdout closed by the reader, stopping")
+
+        # avoid another EPIPE when the interpreter flushes stdout at exit
+        try:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, self.stream.fileno())
+        except Exception:
+            pass
+
+        self.loop.stop()
+
+    def close(self):
+        """write the pending lines"""
+        self.flush()
@@ -0,0 +1,205 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import asyncio
+import logging
+
+from collections import deque
+from urllib.parse import parse_qsl, urlsplit
+
+from pdns_protobuf_receiver import record
+from pdns_protobuf_receiver.filters import RecordFilter, parse_filter
+from pdns_protobuf_receiver.handoff import UNIX_SERVER_OPTIONS
+
+# time given to a subscriber to send its request
+TAIL_REQUEST_TIMEOUT = 10.0
+
+TAIL_HTTP_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: application/x-ndjson\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"Connection: close\r\n\r\n"
+)
+
+
+class Subscriber(RecordFilter):
+    def __init__(self, filters, queue_size):
+        """prepare the filters, raise ValueError when invalid"""
+        RecordFilter.__init__(self, filters)
+
+        # the oldest payloads are dropped when the subscriber is too slow
+        self.queue = deque(maxlen=queue_size)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, dns_json):
+        """queue the payload, wake up the writer"""
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(dns_json)
+        self.ready.set()
+
+
+def parse_request(line):
+    """parse the request line, return (filters, http)"""
+    line = line.decode("ascii", errors="replace").strip()
+
+    # GET /?qname=example.com&rcode=NXDOMAIN HTTP/1.1
+    if line.startswith("GET "):
+        return parse_qsl(urlsplit(line.split()[1]).query), True
+
+    # qname=example.com rcode=NXDOMAIN
+    return parse_filter(line), False
+
+
+async def wait_eof(reader):
+    """read and ignore the data until the subscriber goes away"""
+    while await reader.read(4096):
+        pass
+
+
+class TailServer(object):
+    def __init__(self, outputs, queue_size=1000):
+        """prepare the class, outputs is the list of the record outputs"""
+        self.outputs = outputs
+        self.queue_size = queue_size
+        self.subscribers = []
+        self.writers = set()
+        self.server = None
+        self.path = None
+
+    async def start(self, ip, port, path=None, sock=None):
+        """start the server socket, or serve the listening socket inherited"""
+        if sock is not None:
+            if path is not None:
+                self.server = await asyncio.start_unix_server(
+                    self.handle, sock=sock, **UNIX_SERVER_OPTIONS
+                )
+                self.path = path
+            else:
+                self.server = await asyncio.start_server(self.handle, sock=sock)
+        elif path is not None:
+            self.server = await asyncio.start_unix_server(
+                self.handle, path=path, **UNIX_SERVER_OPTIONS
+            )
+            os.chmod(path, 0o600)
+            self.path = path
+        else:
+            self.server = await asyncio.start_server(self.handle, host=ip, port=port)
+        logging.debug("tail listening on %s" % (path or "%s:%s" % (ip, port)))
+
+    def detach(self):
+        """return the listening socket, left in place for a new process"""
+        self.path = None
+        return self.server.sockets[0]
+
+    def subscribe(self, subscriber):
+        """add the subscriber, the output is only used with subscribers"""
+        if not self.subscribers:
+            self.outputs.append(self)
+        self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        """remove the subscriber"""
+        self.subscribers.remove(subscriber)
+        if not self.subscribers:
+            self.outputs.remove(self)
+
+    async def handle(self, reader, writer):
+        """read the filters of the subscriber then stream the records"""
+        peer = writer.get_extra_info("peername") or "unix"
+        self.writers.add(writer)
+        try:
+            try:
+                line = await asyncio.wait_for(reader.readline(), TAIL_REQUEST_TIMEOUT)
+                filters, http = parse_request(line)
+                if http:
+                    while (await reader.readline()).strip():
+                        pass
+                subscriber = Subscriber(filters, self.queue_size)
+            except (ValueError, IndexError, asyncio.TimeoutError) as e:
+                writer.write(b"error: %s\n" % str(e).encode())
+                return
+
+            if http:
+                writer.write(TAIL_HTTP_HEADERS)
+
+            logging.debug("tail subscriber %s: %s" % (peer, filters))
+            self.subscribe(subscriber)
+            try:
+                await self.serve(subscriber, reader, writer)
+            finally:
+                self.unsubscribe(subscriber)
+                logging.debug(
+                    "tail subscriber %s gone, %s payloads dropped"
+                    % (peer, subscriber.dropped)
+                )
+        except ConnectionError:
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def serve(self, subscriber, reader, writer):
+        """write the queued payloads until the subscriber goes away"""
+        eof = asyncio.ensure_future(wait_eof(reader))
+        try:
+            while not eof.done():
+                ready = asyncio.ensure_future(subscriber.ready.wait())
+                await asyncio.wait([ready, eof], return_when=asyncio.FIRST_COMPLETED)
+                ready.cancel()
+                if eof.done():
+                    break
+
+                subscriber.ready.clear()
+                lines = list(subscriber.queue)
+                subscriber.queue.clear()
+                writer.write(("\n".join(lines) + "\n").encode())
+                await writer.drain()
+        finally:
+            eof.cancel()
+
+    def write(self, dns_record):
+        """encode the record once for all the matching subscribers"""
+        dns_json = None
+        for subscriber in self.subscribers:
+            if subscriber.match(dns_record):
+                if dns_json is None:
+                    dns_json = record.to_json(dns_record)
+                subscriber.push(dns_json)
+
+    def flush(self):
+        """nothing to flush, the payloads are written by the subscribers"""
+        pass
+
+    def close(self):
+        """stop the server and disconnect the subscribers"""
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        for writer in list(self.writers):
+            writer.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
@@ -0,0 +1,260 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from google.protobuf.internal import api_implementation
+
+from pdns_protobuf_receiver.dnsmessage_pb2 import PBDNSMessage
+
+# protobuf wire types
+WIRETYPE_VARINT = 0
+WIRETYPE_FIXED64 = 1
+WIRETYPE_LENGTH_DELIMITED = 2
+WIRETYPE_FIXED32 = 5
+
+# PBDNSMessageList starts with its repeated msg field (1, length delimited),
+# PBDNSMessage can not as its field 1 is the type varint
+MESSAGE_LIST_TAG = (1 << 3) | WIRETYPE_LENGTH_DELIMITED
+
+
+def backend():
+    """return the name of the active protobuf backend"""
+    return api_implementation.Type()
+
+
+class WireError(Exception):
+    pass
+
+
+def read_varint(buf, pos, end):
+    """decode a varint, return the value and the new position"""
+    if pos >= end:
+        raise WireError("truncated varint")
+    b = buf[pos]
+    pos += 1
+    if b < 0x80:
+        return b, pos
+
+    result = b & 0x7F
+    shift = 7
+    while True:
+        if pos >= end or shift > 63:
+            raise WireError("bad varint")
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def scan(buf, pos, end):
+    """iterate over (field number, wire type, value) of a message
+
+    varints are decoded, length delimited fields are returned as (start, end)
+    offsets so nested messages are scanned in place without copy
+    """
+    while pos < end:
+        tag, pos = read_varint(buf, pos, end)
+        field, wiretype = tag >> 3, tag & 0x07
+
+        if wiretype == WIRETYPE_VARINT:
+            value, pos = read_varint(buf, pos, end)
+        elif wiretype == WIRETYPE_LENGTH_DELIMITED:
+            length, pos = read_varint(buf, pos, end)
+            value = (pos, pos + length)
+            pos += length
+        elif wiretype == WIRETYPE_FIXED64:
+            value = None
+            pos += 8
+        elif wiretype == WIRETYPE_FIXED32:
+            value = None
+            pos += 4
+        else:
+            raise WireError("unsupported wire type %s" % wiretype)
+
+        if pos > end:
+            raise WireError("truncated field %s" % field)
+
+        yield field, wiretype, value
+
+
+def encode_varint(value):
+    """encode a varint"""
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def is_message_list(payload):
+    """return True if the payload is a PBDNSMessageList"""
+    return len(payload) > 0 and payload[0] == MESSAGE_LIST_TAG
+
+
+def split_message_list(payload):
+    """return the PBDNSMessage payloads of a PBDNSMessageList, without decoding them"""
+    payloads = []
+    for field, wiretype, value in scan(payload, 0, len(payload)):
+        if field == 1 and wiretype == WIRETYPE_LENGTH_DELIMITED:
+            payloads.append(payload[value[0] : value[1]])
+    return payloads
+
+
+def encode_message_list_entry(payload):
+    """encode a PBDNSMessage payload as an entry of a PBDNSMessageList"""
+    return bytes((MESSAGE_LIST_TAG,)) + encode_varint(len(payload)) + payload
+
+
+class WireQuestion(object):
+    __slots__ = ("qName", "qType", "qClass")
+
+    def __init__(self):
+        """prepare the class"""
+        self.qName = ""
+        self.qType = 0
+        self.qClass = 0
+
+
+class WireResponse(object):
+    __slots__ = ("rcode", "queryTimeSec", "queryTimeUsec")
+
+    def __init__(self):
+        """prepare the class"""
+        self.rcode = 0
+        self.queryTimeSec = 0
+        self.queryTimeUsec = 0
+
+
+class WireMessage(object):
+    """PBDNSMessage look-alike decoding only the hot fields
+
+    any other field is read from the generated class, decoded on first access
+    """
+
+    __slots__ = (
+        "type",
+        "messageId",
+        "serverIdentity",
+        "socketFamily",
+        "socketProtocol",
+        "from",
+        "to",
+        "inBytes",
+        "timeSec",
+        "timeUsec",
+        "id",
+        "question",
+        "response",
+        "payload",
+        "fallback",
+    )
+
+    def ParseFromString(self, payload):
+        """decode the payload, the generated class is used on malformed data"""
+        self.payload = payload
+        self.fallback = None
+        try:
+            self.parse(payload)
+        except (WireError, IndexError, UnicodeDecodeError):
+            self.parse_fallback()
+
+    def parse(self, buf):
+        """scan the top level fields"""
+        self.type = None
+        self.messageId = b""
+        self.serverIdentity = b""
+        self.socketFamily = PBDNSMessage.SocketFamily.INET
+        self.socketProtocol = PBDNSMessage.SocketProtocol.UDP
+        setattr(self, "from", b"")
+        self.to = b""
+        self.inBytes = 0
+        self.timeSec = 0
+        self.timeUsec = 0
+        self.id = 0
+        question = self.question = WireQuestion()
+        response = self.response = WireResponse()
+
+        for field, wiretype, value in scan(buf, 0, len(buf)):
+            if field == 1 and wiretype == WIRETYPE_VARINT:
+                self.type = value
+            elif field == 4 and wiretype == WIRETYPE_VARINT:
+                self.socketFamily = value
+            elif field == 5 and wiretype == WIRETYPE_VARINT:
+                self.socketProtocol = value
+            elif field == 6 and wiretype == WIRETYPE_LENGTH_DELIMITED:
+                setattr(self, "from", buf[value[0] : value[1]])
+            elif field == 7 and wiretype == WIRETYPE_LENGTH_DELIMITED:
+                self.to = buf[value[0] : value[1]]
+            elif field == 8 and wiretype == WIRETYPE_VARINT:
+                self.inBytes = value
+            elif field == 9 and wiretype == WIRETYPE_VARINT:
+                self.timeSec = value
+            elif field == 10 and wiretype == WIRETYPE_VARINT:
+                self.timeUsec = value
+            elif field == 12 and wiretype == WIRETYPE_LENGTH_DELIMITED:
+                for f, w, v in scan(buf, value[0], value[1]):
+                    if f == 1 and w == WIRETYPE_LENGTH_DELIMITED:
+                        question.qName = buf[v[0] : v[1]].decode()
+                    elif f == 2 and w == WIRETYPE_VARINT:
+                        question.qType = v
+                    elif f == 3 and w == WIRETYPE_VARINT:
+                        question.qClass = v
+            elif field == 13 and wiretype == WIRETYPE_LENGTH_DELIMITED:
+                for f, w, v in scan(buf, value[0], value[1]):
+                    if f == 1 and w == WIRETYPE_VARINT:
+                        response.rcode = v
+                    elif f == 5 and w == WIRETYPE_VARINT:
+                        response.queryTimeSec = v
+                    elif f == 6 and w == WIRETYPE_VARINT:
+                        response.queryTimeUsec = v
+            elif field == 2 and wiretype == WIRETYPE_LENGTH_DELIMITED:
+                self.messageId = buf[value[0] : value[1]]
+            elif field == 3 and wiretype == WIRETYPE_LENGTH_DELIMITED:
+                self.serverIdentity = buf[value[0] : value[1]]
+            elif field == 11 and wiretype == WIRETYPE_VARINT:
+                self.id = value
+
+        # the type is required
+        if self.type is None:
+            raise WireError("missing message type")
+
+    def parse_fallback(self):
+        """decode with the generated class, raise on invalid payload"""
+        dns_pb2 = PBDNSMessage()
+        dns_pb2.ParseFromString(self.payload)
+        self.fallback = dns_pb2
+
+        for name in WireMessage.__slots__[:-2]:
+            setattr(self, name, getattr(dns_pb2, name))
+
+    def __getattr__(self, name):
+        """read the other fields from the generated class"""
+        if name in ("payload", "fallback"):
+            raise AttributeError(name)
+        if self.fallback is None:
+            self.fallback = PBDNSMessage()
+            self.fallback.ParseFromString(self.payload)
+        return getattr(self.fallback, name)
@@ -20,4 +20,52 @@
 # AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
-# SOFTWARE.
\ No newline at end of file
+# SOFTWARE.
+
+import socket
+
+from pdns_protobuf_receiver.dnsmessage_pb2 import PBDNSMessage
+from pdns_protobuf_receiver import record
+
+
+def new_record(
+    qname="www.example.com.",
+    msg_type=PBDNSMessage.Type.DNSResponseType,
+    qtype=1,
+    rcode=0,
+    address="10.0.0.1",
+    to_address=None,
+    protocol=PBDNSMessage.SocketProtocol.UDP,
+    query_time=0,
+    latency=0,
+    in_bytes=0,
+    listener=None,
+):
+    """return the record of a dns message, times in microseconds"""
+    dns_pb2 = PBDNSMessage()
+    dns_pb2.type = msg_type
+    if ":" in address:
+        family = socket.AF_INET6
+        dns_pb2.socketFamily = PBDNSMessage.SocketFamily.INET6
+    else:
+        family = socket.AF_INET
+        dns_pb2.socketFamily = PBDNSMessage.SocketFamily.INET
+    dns_pb2.socketProtocol = protocol
+    setattr(dns_pb2, "from", socket.inet_pton(family, address))
+    if to_address is not None:
+        dns_pb2.to = socket.inet_pton(family, to_address)
+    dns_pb2.inBytes = in_bytes
+
+    # the message time is the query time for queries, the response time otherwise
+    msg_time = query_time
+    if msg_type in record.RESPONSE_TYPES:
+        msg_time += latency
+        dns_pb2.response.queryTimeSec = query_time // 1000000
+        dns_pb2.response.queryTimeUsec = query_time % 1000000
+    dns_pb2.timeSec = msg_time // 1000000
+    dns_pb2.timeUsec = msg_time % 1000000
+
+    dns_pb2.response.rcode = rcode
+    dns_pb2.question.qName = qname
+    dns_pb2.question.qType = qtype
+    return record.from_pb(dns_pb2, listener)
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import struct
+import tempfile
+import unittest
+
+from pdns_protobuf_receiver.capture import CaptureWriter, CaptureReader
+
+
+class TestCapture(unittest.TestCase):
+    def test1_capture_replay(self):
+        """test to read back the captured frames"""
+        with tempfile.TemporaryDirectory() as path:
+            writer = CaptureWriter(path, max_size=64)
+            for i in range(10):
+                writer.write(b"payload%d" % i, ts=1000000 + i)
+            writer.close()
+
+            frames = list(CaptureReader(path).frames())
+
+        self.assertEqual(len(frames), 10)
+        self.assertEqual(frames[0], (1000000, struct.pack("!H", 8) + b"payload0"))
+        self.assertEqual(frames[9][0], 1000009)
+
+    def test2_capture_rotate(self):
+        """test segments rotation and index"""
+        with tempfile.TemporaryDirectory() as path:
+            writer = CaptureWriter(path, max_size=64)
+            for i in range(10):
+                writer.write(b"x" * 20, ts=i)
+            writer.close()
+
+            segments = CaptureReader(path).segments()
+            with open("%s/capture.idx" % path) as idx:
+                lines = idx.read().splitlines()
+
+        self.assertEqual(len(segments), 4)
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[0].split()[1:], ["0", "2", "3"])
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import tempfile
+import unittest
+
+from pdns_protobuf_receiver.columnar import (
+    ColumnarBatch,
+    ColumnarOutput,
+    write_columnar,
+    read_columnar,
+)
+
+from tests import new_record
+
+
+class TestColumnar(unittest.TestCase):
+    def test1_batch(self):
+        """test to fill columns with dictionary encoding"""
+        batch = ColumnarBatch(3)
+        batch.append(new_record("a.com.", latency=400))
+        batch.append(new_record("b.com.", latency=400))
+        full = batch.append(new_record("a.com.", rcode=3, latency=400))
+
+        numeric, strings = dict(), dict()
+        for name, col in batch.columns()[0]:
+            numeric[name] = list(col)
+        for name, col, values in batch.columns()[1]:
+            strings[name] = (list(col), values)
+
+        self.assertTrue(full)
+        self.assertEqual(numeric["latency"], [400, 400, 400])
+        self.assertEqual(numeric["return_code"], [0, 0, 3])
+        self.assertEqual(strings["query_name"], ([0, 1, 0], ["a.com.", "b.com."]))
+        self.assertEqual(strings["from_address"], ([0, 0, 0], ["10.0.0.1"]))
+        self.assertEqual(strings["to_address"], ([0, 0, 0], ["0.0.0.0"]))
+
+        batch = ColumnarBatch(2)
+        batch.append(new_record("a.com.", address="2001:db8::1"))
+        batch.append(new_record("a.com.", address="10.0.0.1", listener="edge"))
+        strings = dict((name, values) for name, col, values in batch.columns()[1])
+        self.assertEqual(strings["from_address"], ["2001:db8::1", "10.0.0.1"])
+        self.assertEqual(strings["listener"], ["", "edge"])
+
+    def test2_fallback_format(self):
+        """test to write and read the fallback columnar format"""
+        batch = ColumnarBatch(10)
+        batch.append(new_record("a.com.", query_time=10000100, latency=400))
+        batch.append(new_record("b.com.", query_time=10000100, latency=400))
+
+        with tempfile.TemporaryDirectory() as path:
+            filepath = os.path.join(path, "batch.pdnscol")
+            write_columnar(filepath, batch.rows, *batch.columns())
+            columns = read_columnar(filepath)
+
+        self.assertEqual(list(columns["time"]), [10000500, 10000500])
+        self.assertEqual(columns["query_name"], ["a.com.", "b.com."])
+
+    def test3_output(self):
+        """test to write one file per batch"""
+        with tempfile.TemporaryDirectory() as path:
+            output = ColumnarOutput(path, batch_size=2)
+            for i in range(5):
+                output.write(new_record("a.com."))
+            output.close()
+
+            files = os.listdir(path)
+
+        self.assertEqual(len(files), 3)
+
+    def test4_restart(self):
+        """test to not overwrite the batches of a previous run"""
+        with tempfile.TemporaryDirectory() as path:
+            for run in range(2):
+                output = ColumnarOutput(path, batch_size=1)
+                for i in range(3):
+                    output.write(new_record("a.com."))
+                output.close()
+
+            files = os.listdir(path)
+
+        self.assertEqual(len(files), 6)
@@ -0,0 +1,123 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+import contextlib
+
+from pdns_protobuf_receiver.config import load_config
+from pdns_protobuf_receiver.receiver import parse_args, build_outputs
+from pdns_protobuf_receiver.filters import FilterStage
+
+PUBLIC_SUFFIX_LIST = "com\nco.uk\n"
+
+
+class TestConfig(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "receiver.json")
+        self.psl = os.path.join(self.tmpdir.name, "public_suffix_list.dat")
+        with open(self.psl, "w") as fd:
+            fd.write(PUBLIC_SUFFIX_LIST)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_config(self, config):
+        with open(self.path, "w") as fd:
+            json.dump(config, fd)
+
+    def test1_load(self):
+        """test to load the options with their aliases"""
+        self.write_config(
+            {
+                "listen": "edge=0.0.0.0:50001",
+                "file-compress": "zstd",
+                "exclude": [{"qname": "example.com", "rcode": "NOERROR"}, "qtype=PTR"],
+            }
+        )
+        values = load_config(self.path, set(["l", "file_compress", "exclude"]))
+        self.assertEqual(values["l"], ["edge=0.0.0.0:50001"])
+        self.assertEqual(values["file_compress"], "zstd")
+        self.assertEqual(values["exclude"], ["qname=example.com rcode=NOERROR", "qtype=PTR"])
+
+        self.write_config({"bogus": 1})
+        with self.assertRaises(ValueError):
+            load_config(self.path, set(["l"]))
+
+    def test2_command_line(self):
+        """test to override the configuration file on the command line"""
+        self.write_config({"listen": ["0.0.0.0:50001"], "sampling": 0.5, "stats": 60})
+        args = parse_args(["--config", self.path, "--stats", "10", "-l", "unix:/tmp/a"])
+        self.assertEqual(args.sampling, 0.5)
+        self.assertEqual(args.stats, 10)
+        self.assertEqual(args.l, ["0.0.0.0:50001", "unix:/tmp/a"])
+
+    def test3_rebuild(self):
+        """test to keep the outputs whose settings did not change"""
+        loop = asyncio.new_event_loop()
+        outputs = {"raw": [], "stage": [], "json": [], "record": []}
+
+        args = parse_args(["--psl", self.psl, "--exclude", "qname=example.com", "-j", "x:1"])
+        built, components = build_outputs(args, loop, None, outputs, {})
+        self.assertIsInstance(built["stage"][0], FilterStage)
+        domain = built["stage"][1]
+
+        args = parse_args(["--psl", self.psl, "--sampling", "0.1", "-j", "x:1"])
+        built, components = build_outputs(args, loop, None, outputs, components)
+        self.assertEqual(built["stage"][0].sampling, 0.1)
+        self.assertIs(built["stage"][1], domain)
+
+        args = parse_args(["--psl", self.psl, "--psl-cache", "10", "-j", "x:1"])
+        built, components = build_outputs(args, loop, None, outputs, components)
+        self.assertIsNot(built["stage"][0], domain)
+
+        args = parse_args(["--psl", "/nonexistent", "-j", "x:1"])
+        with self.assertRaises(Exception):
+            build_outputs(args, loop, None, outputs, components)
+        loop.close()
+
+    def test4_validation(self):
+        """test to validate the values of the configuration file like the command line"""
+        self.write_config({"stats": "60", "v": True, "exclude": "qtype=PTR"})
+        args = parse_args(["--config", self.path])
+        self.assertEqual(args.stats, 60)
+        self.assertTrue(args.v)
+        self.assertEqual(args.exclude, ["qtype=PTR"])
+
+        for config in ({"file-compress": "lz4"}, {"budget-frames": "many"}):
+            self.write_config(config)
+            with contextlib.redirect_stderr(io.StringIO()):
+                with self.assertRaises(SystemExit):
+                    parse_args(["--config", self.path])
+
+        for config in ({"verbose": "yes"}, {"listen": 50001}, {"stats": [60]}):
+            self.write_config(config)
+            with self.assertRaises(ValueError):
+                parse_args(["--config", self.path])
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import time
+import unittest
+
+from pdns_protobuf_receiver import record
+from pdns_protobuf_receiver.dedup import Dedup
+
+from tests import new_record
+
+
+class TestDedup(unittest.TestCase):
+    def test1_collapse(self):
+        """test to collapse the repeats of a window in one record"""
+        emitted = []
+        dedup = Dedup(emitted.append, window=60)
+        for i in range(10):
+            self.assertIsNone(dedup.process(new_record("www.example.com.")))
+        self.assertIsNone(dedup.process(new_record("www.example.net.")))
+        self.assertIsNone(dedup.process(new_record("www.example.com.", address="10.0.0.2")))
+
+        dedup.flush()
+        self.assertEqual(emitted, [])
+
+        dedup.close()
+        self.assertEqual([r.repeats for r in emitted], [10, 1, 1])
+        self.assertEqual(json.loads(record.to_json(emitted[0]))["repeats"], 10)
+
+    def test2_window(self):
+        """test to emit the held records when the window is elapsed"""
+        emitted = []
+        dedup = Dedup(emitted.append, window=0.05)
+        dedup.process(new_record("www.example.com."))
+        time.sleep(0.1)
+        dedup.flush()
+        self.assertEqual(len(emitted), 1)
+
+        dedup.process(new_record("www.example.com."))
+        self.assertEqual(len(emitted), 1)
+
+    def test3_bounded(self):
+        """test to let the records go through when the bucket is full"""
+        emitted = []
+        dedup = Dedup(emitted.append, window=60, max_entries=4)
+        passed = [dedup.process(new_record("www%d.example.com." % i)) for i in range(6)]
+        self.assertEqual(len(dedup.held), 4)
+        self.assertIsNone(passed[3])
+        self.assertIsNone(passed[4].repeats)
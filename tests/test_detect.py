@@ -0,0 +1,96 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import base64
+import unittest
+
+from pdns_protobuf_receiver.dnsmessage_pb2 import PBDNSMessage
+from pdns_protobuf_receiver.detect import TunnelDetection, shannon_entropy
+
+from tests import new_record
+
+
+class TestDetect(unittest.TestCase):
+    def test1_entropy(self):
+        """test to compute the entropy of a name"""
+        self.assertEqual(shannon_entropy(""), 0.0)
+        self.assertEqual(shannon_entropy("aaaa"), 0.0)
+        self.assertEqual(shannon_entropy("abcd"), 2.0)
+
+    def test2_tunnel(self):
+        """test to raise an alert for long random unique subdomains"""
+        alerts = []
+        detect = TunnelDetection(alerts.append, window=50)
+        for i in range(50):
+            data = base64.b32encode(i.to_bytes(4, "big") * 10).decode().strip("=")
+            detect.write(new_record("%s.t.example.com." % data.lower()))
+
+        self.assertEqual(len(alerts), 1)
+        alert = json.loads(alerts[0])
+        self.assertEqual(alert["dns_message"], "ALERT")
+        self.assertEqual(alert["from_address"], "10.0.0.1")
+        self.assertEqual(alert["responses"], 50)
+        self.assertIn("label_length", alert["crossed"])
+        self.assertIn("unique_ratio", alert["crossed"])
+
+    def test3_dga(self):
+        """test to raise an alert on the nxdomain ratio only"""
+        alerts = []
+        detect = TunnelDetection(alerts.append, window=10)
+        for i in range(10):
+            detect.write(new_record("www.example%d.com." % (i % 2), rcode=3))
+
+        self.assertEqual(json.loads(alerts[0])["crossed"], ["nxdomain_ratio"])
+
+    def test4_normal(self):
+        """test to not raise alerts for usual traffic"""
+        alerts = []
+        detect = TunnelDetection(alerts.append, window=10)
+        for i in range(100):
+            detect.write(new_record("www.example.com."))
+        self.assertEqual(alerts, [])
+
+    def test5_bounded(self):
+        """test to forget the least recent clients"""
+        detect = TunnelDetection(lambda j: None, max_clients=8)
+        for i in range(100):
+            detect.write(new_record("www.example.com.", address="10.0.0.%d" % i))
+        self.assertEqual(len(detect.clients), 8)
+        self.assertEqual(next(reversed(detect.clients))[1], bytes([10, 0, 0, 99]))
+
+    def test6_client_responses(self):
+        """test to analyse the client responses only"""
+        detect = TunnelDetection(lambda j: None)
+        for msg_type in (
+            PBDNSMessage.Type.DNSQueryType,
+            PBDNSMessage.Type.DNSOutgoingQueryType,
+            PBDNSMessage.Type.DNSIncomingResponseType,
+        ):
+            detect.write(new_record("www.example.com.", msg_type=msg_type))
+        self.assertEqual(len(detect.clients), 0)
+
+        detect.write(new_record("www.example.com."))
+        self.assertEqual(len(detect.clients), 1)
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import json
+import tempfile
+import unittest
+
+from pdns_protobuf_receiver import record
+from pdns_protobuf_receiver.enrich import GeoEnrichment, IntervalIndex
+from pdns_protobuf_receiver.enrich import DomainEnrichment, SuffixTrie
+
+from tests import new_record
+
+DATABASE = """range_start\trange_end\tAS_number\tcountry_code\tAS_description
+1.0.0.0\t1.0.0.255\t13335\tUS\tCLOUDFLARENET
+1.0.1.0\t1.0.3.255\t0\tNone\tNot routed
+1.0.4.0\t1.0.7.255\t38803\tAU\tWPL-AS-AP
+2001:db8::\t2001:db8::ffff\t64500\tFR\tDOC
+"""
+
+PUBLIC_SUFFIX_LIST = """// ===BEGIN ICANN DOMAINS===
+com
+uk
+co.uk
+*.ck
+!www.ck
+// ===END ICANN DOMAINS===
+"""
+
+
+class TestEnrich(unittest.TestCase):
+    def setUp(self):
+        self.fd, self.path = tempfile.mkstemp(suffix=".tsv")
+        with os.fdopen(self.fd, "w") as fd:
+            fd.write(DATABASE)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test1_index(self):
+        """test to lookup unsorted ranges"""
+        index = IntervalIndex([(20, 29, "b"), (0, 9, "a"), (40, 49, "c")], "I")
+        self.assertEqual(index.lookup(0), "a")
+        self.assertEqual(index.lookup(25), "b")
+        self.assertEqual(index.lookup(49), "c")
+        self.assertIsNone(index.lookup(15))
+        self.assertIsNone(index.lookup(50))
+
+    def test2_enrich(self):
+        """test to enrich IPv4 and IPv6 clients"""
+        geo = GeoEnrichment(self.path)
+
+        dns_record = new_record(address="1.0.5.1")
+        geo.process(dns_record)
+        payload = json.loads(record.to_json(dns_record))
+        self.assertEqual(payload["from_asn"], 38803)
+        self.assertEqual(payload["from_country"], "AU")
+
+        dns_record = new_record(address="2001:db8::1")
+        geo.process(dns_record)
+        self.assertEqual(dns_record.from_asn, 64500)
+
+    def test3_unknown(self):
+        """test to keep the payload unchanged for unknown clients"""
+        geo = GeoEnrichment(self.path)
+        for address in ("1.0.2.1", "192.0.2.1"):
+            dns_record = new_record(address=address)
+            geo.process(dns_record)
+            self.assertNotIn("from_asn", json.loads(record.to_json(dns_record)))
+
+    def test4_reload(self):
+        """test to reload the database when the file changes"""
+        geo = GeoEnrichment(self.path, reload_interval=0)
+        with open(self.path, "w") as fd:
+            fd.write("192.0.2.0,192.0.2.255,AS64501,NL\n")
+        os.utime(self.path, (0, 0))
+
+        geo.flush()
+        geo.loading.join()
+        geo.flush()
+
+        dns_record = new_record(address="192.0.2.1")
+        geo.process(dns_record)
+        self.assertEqual((dns_record.from_asn, dns_record.from_country), (64501, "NL"))
+
+    def test5_registered_domain(self):
+        """test to find the registered domain with wildcard and exception rules"""
+        trie = SuffixTrie(["com", "uk", "co.uk", "*.ck", "!www.ck"])
+        self.assertEqual(trie.registered_domain("www.Example.COM."), "example.com")
+        self.assertEqual(trie.registered_domain("a.b.example.co.uk."), "example.co.uk")
+        self.assertEqual(trie.registered_domain("a.b.foo.ck."), "b.foo.ck")
+        self.assertEqual(trie.registered_domain("a.www.ck."), "www.ck")
+        self.assertEqual(trie.registered_domain("host.example.lan."), "example.lan")
+        self.assertIsNone(trie.registered_domain("co.uk."))
+        self.assertIsNone(trie.registered_domain("."))
+
+    def test6_domain_enrich(self):
+        """test to add the registered domain to the payload"""
+        with open(self.path, "w") as fd:
+            fd.write(PUBLIC_SUFFIX_LIST)
+        domain = DomainEnrichment(self.path)
+
+        dns_record = new_record("mail.example.co.uk.", address="192.0.2.1")
+        domain.process(dns_record)
+        payload = json.loads(record.to_json(dns_record))
+        self.assertEqual(payload["registered_domain"], "example.co.uk")
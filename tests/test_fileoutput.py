@@ -0,0 +1,111 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import gzip
+import json
+import time
+import zlib
+import tempfile
+import unittest
+
+from pdns_protobuf_receiver.fileoutput import FileOutput
+
+
+class TestFileOutput(unittest.TestCase):
+    def test1_write_gzip(self):
+        """test to write records to a gzip file"""
+        with tempfile.TemporaryDirectory() as path:
+            output = FileOutput(path, batch_size=3)
+            for i in range(10):
+                output.write(json.dumps({"id": i}))
+            output.close()
+
+            files = sorted(os.listdir(path))
+            with gzip.open(os.path.join(path, files[0])) as fd:
+                records = [json.loads(l) for l in fd.read().splitlines()]
+            with open(os.path.join(path, files[1])) as fd:
+                meta = json.load(fd)
+
+        self.assertEqual(len(files), 2)
+        self.assertEqual([r["id"] for r in records], list(range(10)))
+        self.assertEqual(meta["count"], 10)
+        self.assertTrue(meta["closed"])
+        self.assertLessEqual(meta["first"], meta["last"])
+
+    def test2_rotate_size(self):
+        """test files rotation on size"""
+        with tempfile.TemporaryDirectory() as path:
+            output = FileOutput(path, compress="none", rotate_size=10, batch_size=1)
+            for i in range(3):
+                output.write("x" * 20)
+            output.close()
+
+            files = [f for f in os.listdir(path) if not f.endswith(".meta")]
+
+        self.assertEqual(len(files), 3)
+
+    def test3_restart(self):
+        """test to not append to the file of a previous run in the same period"""
+        with tempfile.TemporaryDirectory() as path:
+            for run in range(2):
+                output = FileOutput(path, compress="none")
+                for i in range(5):
+                    output.write(json.dumps({"run": run}))
+                output.close()
+
+            metas = []
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith(".meta"):
+                    with open(os.path.join(path, filename)) as fd:
+                        metas.append(json.load(fd))
+
+        self.assertEqual(len(metas), 2)
+        self.assertEqual([m["count"] for m in metas], [5, 5])
+        self.assertNotEqual(metas[0]["file"], metas[1]["file"])
+
+    def test4_sync_before_meta(self):
+        """test to find on the disk the records counted by the metadata"""
+        with tempfile.TemporaryDirectory() as path:
+            output = FileOutput(path, batch_size=100)
+            for i in range(1000):
+                output.write(json.dumps({"id": i}))
+
+            # the file is not closed, as after a crash
+            filepath = None
+            for i in range(100):
+                metas = [f for f in os.listdir(path) if f.endswith(".meta")]
+                if metas:
+                    with open(os.path.join(path, metas[0])) as fd:
+                        meta = json.load(fd)
+                    if meta["count"] == 1000:
+                        filepath = os.path.join(path, meta["file"])
+                        break
+                time.sleep(0.05)
+            with open(filepath, "rb") as fd:
+                data = zlib.decompressobj(wbits=31).decompress(fd.read())
+            output.close()
+
+        self.assertFalse(meta["closed"])
+        self.assertEqual(len(data.splitlines()), 1000)
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import asyncio
+import struct
+import unittest
+
+from unittest import mock
+
+from pdns_protobuf_receiver import handoff
+from pdns_protobuf_receiver.receiver import cb_handoff
+from pdns_protobuf_receiver.protobuf import ProtoBufHandler
+from pdns_protobuf_receiver.scheduler import Scheduler
+
+
+def frame(payload):
+    return struct.pack("!H", len(payload)) + payload
+
+
+class TestHandoff(unittest.TestCase):
+    def test1_message(self):
+        """test to pass file descriptors and data to another process"""
+        previous, new = handoff.channel_pair()
+        r, w = os.pipe()
+        try:
+            handoff.send_message(previous, {"listener": "edge"}, [w], b"\x00\n" * 50000)
+            header, fds, data = handoff.recv_message(new)
+            self.assertEqual(header, {"listener": "edge"})
+            self.assertEqual(data, b"\x00\n" * 50000)
+
+            os.write(fds[0], b"ok")
+            os.close(fds[0])
+            self.assertEqual(os.read(r, 2), b"ok")
+
+            previous.close()
+            self.assertIsNone(handoff.recv_message(new))
+        finally:
+            os.close(r)
+            os.close(w)
+            new.close()
+
+    def test2_unprocessed(self):
+        """test to pass the bytes read and not processed yet"""
+
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(frame(b"abc") + frame(b"defgh")[:4])
+
+            streamer = ProtoBufHandler()
+            streamer.append(data=await reader.read(2))
+            streamer.append(data=await reader.read(1))
+            streamer.process_data()
+            return handoff.unprocessed(reader, streamer)
+
+        data = asyncio.run(run())
+        streamer = ProtoBufHandler()
+        streamer.append(data=data + b"fgh")
+        self.assertTrue(streamer.process_data())
+        self.assertEqual(streamer.decode(), b"abc")
+        self.assertTrue(streamer.process_data())
+        self.assertEqual(streamer.decode(), b"defgh")
+
+    def test3_drain(self):
+        """test to serve all the pending frames at once"""
+        processed = []
+
+        async def run():
+            scheduler = Scheduler(
+                lambda peer, payload, ts: processed.append(payload), budget_frames=2
+            )
+            peer = scheduler.register("busy")
+            for i in range(10):
+                await scheduler.push(peer, b"%d" % i)
+            scheduler.unregister(peer)
+            scheduler.drain()
+            return scheduler
+
+        scheduler = asyncio.run(run())
+        self.assertEqual(len(processed), 10)
+        self.assertEqual(scheduler.peers, set())
+
+    def test4_unsupported(self):
+        """test to keep running without spawning on an old python"""
+
+        async def run():
+            state = {"lock": asyncio.Lock(), "channel": None}
+            with mock.patch.object(handoff, "HANDOFF_MIN_VERSION", (99,)):
+                with mock.patch.object(handoff, "spawn") as spawn:
+                    with self.assertLogs(level="ERROR") as logs:
+                        await cb_handoff(state, asyncio.get_event_loop(), None)
+            return state, spawn, logs
+
+        state, spawn, logs = asyncio.run(run())
+        self.assertFalse(spawn.called)
+        self.assertIsNone(state["channel"])
+        self.assertIn("python 99 or later is required", logs.output[0])
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import grp
+import stat
+import socket
+import asyncio
+import tempfile
+import unittest
+
+from pdns_protobuf_receiver.capture import CaptureWriter, CaptureReader
+from pdns_protobuf_receiver.replay import connect, replay
+from pdns_protobuf_receiver.scheduler import Scheduler
+from pdns_protobuf_receiver.receiver import (
+    parse_listener,
+    remove_stale_socket,
+    start_listener,
+    handle_remoteclient,
+)
+
+
+class TestListeners(unittest.TestCase):
+    def test1_parse_listener(self):
+        """test to parse the listen addresses"""
+        self.assertEqual(parse_listener("0.0.0.0:50001"), (None, "0.0.0.0", 50001, None))
+        self.assertEqual(parse_listener("edge=10.0.0.1:50001"), ("edge", "10.0.0.1", 50001, None))
+        self.assertEqual(parse_listener("v6=[::]:50002"), ("v6", "::", 50002, None))
+        self.assertEqual(parse_listener("::1:50002"), (None, "::1", 50002, None))
+        self.assertEqual(
+            parse_listener("local=unix:/run/pdns.sock"), ("local", None, None, "/run/pdns.sock")
+        )
+        self.assertEqual(
+            parse_listener("unix:/run/a=b.sock"), (None, None, None, "/run/a=b.sock")
+        )
+
+    def test2_bad_listener(self):
+        """test bad listen addresses"""
+        for listener in ["0.0.0.0", "edge=", "unix:", "a=b=c"]:
+            with self.assertRaises(ValueError):
+                parse_listener(listener)
+
+    def test3_stale_socket(self):
+        """test to remove only the stale socket files"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "pdns.sock")
+            remove_stale_socket(path)
+
+            # a socket still listening is kept
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(path)
+            sock.listen(1)
+            with self.assertRaises(ValueError):
+                remove_stale_socket(path)
+            self.assertTrue(os.path.exists(path))
+
+            # the socket left by a closed server is removed
+            sock.close()
+            remove_stale_socket(path)
+            self.assertFalse(os.path.exists(path))
+
+            # any other file is kept
+            with open(path, "w") as f:
+                f.write("data")
+            with self.assertRaises(ValueError):
+                remove_stale_socket(path)
+            self.assertTrue(os.path.exists(path))
+
+    def test4_unix_listener(self):
+        """test to receive the frames replayed to a unix listener"""
+        processed = []
+
+        async def run(path, capture):
+            scheduler = Scheduler(lambda peer, payload, ts: processed.append(payload))
+            group = grp.getgrgid(os.getgid()).gr_name
+            listener = (None, None, None, path)
+            servers = await start_listener(listener, scheduler, 0o660, group)
+            mode = os.stat(path)
+
+            # the replay tool is blocking
+            sock = await asyncio.get_event_loop().run_in_executor(None, connect, None, None, path)
+            await asyncio.get_event_loop().run_in_executor(
+                None, replay, CaptureReader(capture), sock, 0
+            )
+            sock.close()
+
+            for i in range(100):
+                scheduler.run_round()
+                if len(processed) == 3:
+                    break
+                await asyncio.sleep(0.01)
+            for server in servers:
+                server.close()
+            return mode
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            capture = os.path.join(tmpdir, "capture")
+            writer = CaptureWriter(capture, max_size=64)
+            for i in range(3):
+                writer.write(b"payload%d" % i, ts=i)
+            writer.close()
+
+            mode = asyncio.run(run(os.path.join(tmpdir, "pdns.sock"), capture))
+
+        self.assertTrue(stat.S_ISSOCK(mode.st_mode))
+        self.assertEqual(stat.S_IMODE(mode.st_mode), 0o660)
+        self.assertEqual(mode.st_gid, os.getgid())
+        self.assertEqual(processed, [b"payload0", b"payload1", b"payload2"])
+
+    def test5_unix_remote(self):
+        """test to write the json payloads to a unix socket"""
+
+        async def run(path):
+            received = asyncio.get_event_loop().create_future()
+
+            async def handle(reader, writer):
+                received.set_result(await reader.readline())
+                writer.close()
+
+            server = await asyncio.start_unix_server(handle, path=path)
+            tcp_writer = await handle_remoteclient(None, None, path)
+            tcp_writer.write(b'{"id": 1}\n')
+            data = await asyncio.wait_for(received, 5)
+            tcp_writer.close()
+            server.close()
+            return data
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = asyncio.run(run(os.path.join(tmpdir, "json.sock")))
+
+        self.assertEqual(data, b'{"id": 1}\n')
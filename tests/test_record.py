@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import unittest
+
+from pdns_protobuf_receiver.dnsmessage_pb2 import PBDNSMessage
+from pdns_protobuf_receiver import record
+
+from tests import new_record
+
+
+class TestRecord(unittest.TestCase):
+    def test1_response_json(self):
+        """test to encode a response record"""
+        dns_record = new_record(
+            'www.ex"ämple.com.',
+            qtype=28,
+            rcode=65536,
+            address="2001::1",
+            protocol=PBDNSMessage.SocketProtocol.TCP,
+            query_time=1600000000000999,
+            latency=1122458,
+            in_bytes=120,
+            listener="edge",
+        )
+        expected = {
+            "dns_message": "CLIENT_RESPONSE",
+            "socket_family": "IPv6",
+            "socket protocol": "TCP",
+            "from_address": "2001::1",
+            "to_address": "0.0.0.0",
+            "query_time": "2020-09-13T12:26:40.000999+00:00",
+            "response_time": "2020-09-13T12:26:41.123457+00:00",
+            "latency": 1.122458,
+            "query_type": "AAAA",
+            "query_name": 'www.ex"ämple.com.',
+            "return_code": "NETWORK_ERROR",
+            "bytes": 120,
+            "listener": "edge",
+        }
+        self.assertEqual(record.to_json(dns_record), json.dumps(expected))
+        self.assertEqual(dns_record.latency, 1122458)
+
+    def test2_query_json(self):
+        """test to encode a query record"""
+        dns_record = new_record(
+            "a.",
+            msg_type=PBDNSMessage.Type.DNSQueryType,
+            qtype=65280,
+            address="0.0.0.0",
+            to_address="127.0.0.1",
+            query_time=1600000000000000,
+        )
+        expected = {
+            "dns_message": "CLIENT_QUERY",
+            "socket_family": "IPv4",
+            "socket protocol": "UDP",
+            "from_address": "0.0.0.0",
+            "to_address": "127.0.0.1",
+            "query_time": "2020-09-13T12:26:40+00:00",
+            "response_time": "1970-01-01T00:00:00+00:00",
+            "latency": 0,
+            "query_type": "TYPE65280",
+            "query_name": "a.",
+            "return_code": "NOERROR",
+            "bytes": 0,
+        }
+        self.assertEqual(record.to_json(dns_record), json.dumps(expected))
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import struct
+import unittest
+
+from pdns_protobuf_receiver.dnsmessage_pb2 import PBDNSMessage, PBDNSMessageList
+from pdns_protobuf_receiver.relay import RelayOutput, FRAME_MAX_SIZE
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.closing = False
+
+    def is_closing(self):
+        return self.closing
+
+
+class FakeWriter(object):
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        self.transport.closing = True
+
+    def frames(self):
+        """return the messages of each PBDNSMessageList frame written"""
+        frames = []
+        pos = 0
+        while pos < len(self.data):
+            (size,) = struct.unpack("!H", self.data[pos : pos + 2])
+            msg_list = PBDNSMessageList()
+            msg_list.ParseFromString(self.data[pos + 2 : pos + 2 + size])
+            frames.append(list(msg_list.msg))
+            pos += 2 + size
+        return frames
+
+
+class FakeLoop(object):
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+def new_payload(message_id, size=0):
+    dns_pb2 = PBDNSMessage()
+    dns_pb2.type = PBDNSMessage.Type.DNSQueryType
+    dns_pb2.messageId = message_id
+    dns_pb2.serverIdentity = b"x" * size
+    return dns_pb2.SerializeToString()
+
+
+def new_list(payloads):
+    msg_list = PBDNSMessageList()
+    for payload in payloads:
+        msg_list.msg.add().ParseFromString(payload)
+    return msg_list.SerializeToString()
+
+
+class TestRelay(unittest.TestCase):
+    def test1_split_and_batch(self):
+        """test to relay the single messages and the lists in one list"""
+        writer = FakeWriter()
+        relay = RelayOutput(writer, FakeLoop(), flush_interval=60)
+        relay.write(new_list([new_payload(b"a"), new_payload(b"b")]))
+        relay.write(new_payload(b"c"))
+        self.assertEqual(writer.data, b"")
+
+        relay.flush()
+        frames = writer.frames()
+        self.assertEqual(len(frames), 1)
+        self.assertEqual([m.messageId for m in frames[0]], [b"a", b"b", b"c"])
+
+    def test2_frame_size(self):
+        """test to start a new list before the frame size limit"""
+        writer = FakeWriter()
+        relay = RelayOutput(writer, FakeLoop(), flush_interval=60)
+        for i in range(5):
+            relay.write(new_payload(b"%d" % i, size=20000))
+        relay.close()
+
+        frames = writer.frames()
+        self.assertEqual([len(f) for f in frames], [3, 2])
+        self.assertEqual([m.messageId for f in frames for m in f], [b"0", b"1", b"2", b"3", b"4"])
+        for frame in frames:
+            self.assertLessEqual(sum(len(m.SerializeToString()) + 4 for m in frame), FRAME_MAX_SIZE)
+
+    def test3_too_large(self):
+        """test to drop the messages larger than a frame"""
+        writer = FakeWriter()
+        relay = RelayOutput(writer, FakeLoop(), flush_interval=60)
+        with self.assertLogs(level="WARNING"):
+            relay.write(new_payload(b"big", size=FRAME_MAX_SIZE))
+        relay.write(new_payload(b"small"))
+        relay.flush()
+
+        self.assertEqual([m.messageId for f in writer.frames() for m in f], [b"small"])
+
+    def test4_flush_interval(self):
+        """test to send the pending messages after the flush interval"""
+        writer = FakeWriter()
+        relay = RelayOutput(writer, FakeLoop(), flush_interval=0)
+        relay.write(new_payload(b"a"))
+        self.assertEqual(len(writer.frames()), 1)
+
+        relay.write(new_payload(b"b"))
+        relay.close()
+        self.assertEqual(len(writer.frames()), 2)
+        self.assertTrue(writer.transport.is_closing())
+
+    def test5_connection_lost(self):
+        """test to stop the receiver when the connection is lost"""
+        writer = FakeWriter()
+        loop = FakeLoop()
+        relay = RelayOutput(writer, loop, flush_interval=60)
+        relay.write(new_payload(b"a"))
+        writer.transport.closing = True
+        with self.assertRaises(Exception):
+            relay.flush()
+        self.assertTrue(loop.stopped)
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import time
+import unittest
+
+from pdns_protobuf_receiver.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+    def test1_round_robin(self):
+        """test to serve the peers in turn within the budget"""
+        processed = []
+
+        def process(peer, payload, ts):
+            processed.append((peer.address, payload))
+            return b"server"
+
+        async def run():
+            scheduler = Scheduler(process, budget_frames=2, keep_closed=True)
+            busy = scheduler.register("busy")
+            quiet = scheduler.register("quiet")
+            for i in range(6):
+                await scheduler.push(busy, b"%d" % i)
+            await scheduler.push(quiet, b"q")
+
+            scheduler.run_round()
+            scheduler.unregister(busy)
+            scheduler.run_round()
+            scheduler.run_round()
+            return scheduler.summary()
+
+        summary = asyncio.run(run())
+
+        self.assertEqual(
+            [p[0] for p in processed],
+            ["busy", "busy", "quiet", "busy", "busy", "busy", "busy"],
+        )
+        self.assertEqual(
+            sorted((s["peer"], s["frames"], s["server_identity"]) for s in summary),
+            [("busy", 6, "server"), ("quiet", 1, "server")],
+        )
+
+    def test2_backpressure(self):
+        """test to block the busy peer only"""
+
+        async def run():
+            scheduler = Scheduler(lambda peer, payload, ts: b"", max_pending=4)
+            busy = scheduler.register("busy")
+            for i in range(3):
+                await scheduler.push(busy, b"x")
+
+            push = asyncio.ensure_future(scheduler.push(busy, b"x"))
+            await asyncio.sleep(0)
+            blocked = not push.done()
+
+            scheduler.run_round()
+            await asyncio.sleep(0)
+            return blocked, push.done()
+
+        blocked, released = asyncio.run(run())
+        self.assertTrue(blocked)
+        self.assertTrue(released)
+
+    def test3_arrival_time(self):
+        """test to process the frames with their arrival time"""
+        processed = []
+
+        async def run():
+            scheduler = Scheduler(lambda peer, payload, ts: processed.append(ts))
+            peer = scheduler.register("peer")
+            await scheduler.push(peer, b"x")
+            pushed = time.time()
+            await asyncio.sleep(0.1)
+            scheduler.run_round()
+            return pushed
+
+        pushed = asyncio.run(run())
+        self.assertEqual(len(processed), 1)
+        self.assertLessEqual(processed[0], pushed)
+        self.assertGreater(processed[0], pushed - 0.1)
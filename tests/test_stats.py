@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import unittest
+
+from pdns_protobuf_receiver.dnsmessage_pb2 import PBDNSMessage
+from pdns_protobuf_receiver.stats import WindowStats, import_numpy
+
+from tests import new_record
+
+
+@unittest.skipUnless(import_numpy(), "numpy is not installed")
+class TestStats(unittest.TestCase):
+    def test1_summary(self):
+        """test to compute the window summary"""
+        summaries = []
+        stats = WindowStats(60, emit=summaries.append)
+        stats.write(new_record(msg_type=PBDNSMessage.Type.DNSQueryType, in_bytes=100))
+        for i in range(100):
+            rcode = 3 if i < 25 else 0
+            stats.write(new_record(latency=(i + 1) * 1000, rcode=rcode, in_bytes=100))
+        stats.write(new_record(latency=500, qtype=28, in_bytes=100))
+        stats.close()
+
+        summary = json.loads(summaries[0])
+        self.assertEqual(summary["messages"], 102)
+        self.assertEqual(summary["queries"], 1)
+        self.assertEqual(summary["responses"], 101)
+        self.assertEqual(summary["bytes"], 10200)
+        self.assertEqual(summary["latency"]["max"], 0.1)
+        self.assertEqual(summary["latency"]["p50"], 0.05)
+        self.assertEqual(summary["query_types"], {"A": 101, "AAAA": 1})
+        self.assertEqual(summary["return_codes"]["NXDOMAIN"], round(25 / 101, 6))
+        self.assertEqual(summary["socket_family"], {"IPv4": 102})
+
+    def test2_empty_window(self):
+        """test no summary on empty window"""
+        summaries = []
+        stats = WindowStats(60, emit=summaries.append)
+        stats.close()
+        self.assertEqual(summaries, [])
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import json
+import unittest
+
+from pdns_protobuf_receiver.stdoutput import StdoutOutput
+
+
+class FakeLoop(object):
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class BrokenStream(object):
+    def __init__(self):
+        self.nb_writes = 0
+
+    def write(self, data):
+        self.nb_writes += 1
+        raise BrokenPipeError()
+
+    def flush(self):
+        pass
+
+
+class TestStdoutOutput(unittest.TestCase):
+    def test1_buffer_size(self):
+        """test to write the lines once the buffer is full"""
+        stream = io.BytesIO()
+        output = StdoutOutput(FakeLoop(), stream, buffer_size=150, flush_interval=60)
+        payload = json.dumps({"id": 0, "data": "x" * 20})
+        for i in range(3):
+            output.write(payload)
+        self.assertEqual(stream.getvalue(), b"")
+
+        output.write(payload)
+        self.assertEqual(stream.getvalue().splitlines(), [payload.encode()] * 4)
+
+        output.write(payload)
+        output.close()
+        self.assertEqual(len(stream.getvalue().splitlines()), 5)
+
+    def test2_flush_interval(self):
+        """test to write the lines after the flush interval"""
+        stream = io.BytesIO()
+        output = StdoutOutput(FakeLoop(), stream, flush_interval=0)
+        output.write('{"id": 1}')
+        self.assertEqual(stream.getvalue(), b'{"id": 1}\n')
+
+        output.write('{"id": 2}')
+        self.assertEqual(stream.getvalue(), b'{"id": 1}\n{"id": 2}\n')
+
+    def test3_broken_pipe(self):
+        """test to stop the receiver when the reader is gone"""
+        stream = BrokenStream()
+        loop = FakeLoop()
+        output = StdoutOutput(loop, stream, flush_interval=0)
+        with self.assertLogs(level="ERROR"):
+            output.write('{"id": 1}')
+        self.assertTrue(loop.stopped)
+
+        output.write('{"id": 2}')
+        output.close()
+        self.assertEqual(stream.nb_writes, 1)
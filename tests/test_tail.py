@@ -0,0 +1,91 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import asyncio
+import unittest
+
+from pdns_protobuf_receiver.tail import Subscriber, TailServer
+
+from tests import new_record
+
+
+class TestTail(unittest.TestCase):
+    def test1_filters(self):
+        """test to match the records with the filters"""
+        subscriber = Subscriber(
+            [("qname", "Example.com"), ("client", "10.0.0.0/8"), ("rcode", "NXDOMAIN")], 10
+        )
+        self.assertTrue(subscriber.match(new_record("www.example.com.", rcode=3)))
+        self.assertTrue(subscriber.match(new_record("example.com.", rcode=3)))
+        self.assertFalse(subscriber.match(new_record("www.example.com.", rcode=0)))
+        self.assertFalse(subscriber.match(new_record("www.notexample.com.", rcode=3)))
+        for address in ("11.0.0.1", "a0a::a0a"):
+            dns_record = new_record("www.example.com.", rcode=3, address=address)
+            self.assertFalse(subscriber.match(dns_record))
+
+        for filters in ([("qclass", "IN")], [("client", "10.0.0")], [("rcode", "BOGUS")]):
+            with self.assertRaises(ValueError):
+                Subscriber(filters, 10)
+
+    def test2_drop_oldest(self):
+        """test to drop the oldest payloads of a slow subscriber"""
+        async def push():
+            subscriber = Subscriber([], 3)
+            for i in range(5):
+                subscriber.push(str(i))
+            return subscriber
+
+        subscriber = asyncio.run(push())
+        self.assertEqual(list(subscriber.queue), ["2", "3", "4"])
+        self.assertEqual(subscriber.dropped, 2)
+
+    def test3_subscribe(self):
+        """test to stream the matching records to a subscriber"""
+        outputs = []
+
+        async def subscribe():
+            tail = TailServer(outputs)
+            await tail.start("127.0.0.1", 0)
+            port = tail.server.sockets[0].getsockname()[1]
+
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"qname=example.org\n")
+            while not outputs:
+                await asyncio.sleep(0.01)
+
+            for output in outputs:
+                output.write(new_record("www.example.com."))
+                output.write(new_record("www.example.org."))
+            line = await asyncio.wait_for(reader.readline(), 5)
+
+            writer.close()
+            while outputs:
+                await asyncio.sleep(0.01)
+            tail.close()
+            return json.loads(line)
+
+        self.assertEqual(outputs, [])
+        self.assertEqual(asyncio.run(subscribe())["query_name"], "www.example.org.")
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+
+# MIT License
+
+# Copyright (c) 2020 Denis MACHARD
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+
+from google.protobuf.message import DecodeError
+
+from pdns_protobuf_receiver.dnsmessage_pb2 import PBDNSMessage
+from pdns_protobuf_receiver.wire import WireMessage
+
+HOT_FIELDS = [
+    "type",
+    "messageId",
+    "serverIdentity",
+    "socketFamily",
+    "socketProtocol",
+    "from",
+    "to",
+    "inBytes",
+    "timeSec",
+    "timeUsec",
+    "id",
+]
+
+
+def new_message():
+    dns_pb2 = PBDNSMessage()
+    dns_pb2.type = PBDNSMessage.Type.DNSIncomingResponseType
+    dns_pb2.messageId = b"\x01" * 16
+    dns_pb2.serverIdentity = b"dnsdist"
+    dns_pb2.socketFamily = PBDNSMessage.SocketFamily.INET6
+    dns_pb2.socketProtocol = PBDNSMessage.SocketProtocol.TCP
+    setattr(dns_pb2, "from", b"\x20\x01" + b"\x00" * 13 + b"\x01")
+    dns_pb2.to = b"\x20\x01" + b"\x00" * 13 + b"\x02"
+    dns_pb2.inBytes = 2 ** 40
+    dns_pb2.timeSec = 1600000000
+    dns_pb2.timeUsec = 999999
+    dns_pb2.id = 4242
+    dns_pb2.question.qName = "www.exämple.com."
+    dns_pb2.question.qType = 28
+    dns_pb2.question.qClass = 1
+    dns_pb2.response.rcode = 65536
+    dns_pb2.response.queryTimeSec = 1599999999
+    dns_pb2.response.queryTimeUsec = 1
+    dns_pb2.response.tags.append("tag1")
+    rr = dns_pb2.response.rrs.add()
+    rr.name = "www.exämple.com."
+    rr.ttl = 300
+    dns_pb2.fromPort = 53000
+    return dns_pb2
+
+
+class TestWire(unittest.TestCase):
+    def assertSameMessage(self, dns_pb2, wire_msg):
+        for name in HOT_FIELDS:
+            self.assertEqual(getattr(wire_msg, name), getattr(dns_pb2, name), name)
+        for name in ["qName", "qType", "qClass"]:
+            self.assertEqual(getattr(wire_msg.question, name), getattr(dns_pb2.question, name))
+        for name in ["rcode", "queryTimeSec", "queryTimeUsec"]:
+            self.assertEqual(getattr(wire_msg.response, name), getattr(dns_pb2.response, name))
+
+    def test1_hot_fields(self):
+        """test to decode the hot fields like the generated class"""
+        dns_pb2 = new_message()
+        wire_msg = WireMessage()
+        wire_msg.ParseFromString(dns_pb2.SerializeToString())
+        self.assertSameMessage(dns_pb2, wire_msg)
+        self.assertIsNone(wire_msg.fallback)
+
+    def test2_defaults(self):
+        """test default values of missing fields"""
+        dns_pb2 = PBDNSMessage()
+        dns_pb2.type = PBDNSMessage.Type.DNSQueryType
+        wire_msg = WireMessage()
+        wire_msg.ParseFromString(dns_pb2.SerializeToString())
+        self.assertSameMessage(dns_pb2, wire_msg)
+
+    def test3_other_fields(self):
+        """test to read the other fields from the generated class"""
+        wire_msg = WireMessage()
+        wire_msg.ParseFromString(new_message().SerializeToString())
+        self.assertEqual(wire_msg.fromPort, 53000)
+        self.assertIsNotNone(wire_msg.fallback)
+
+    def test4_reuse(self):
+        """test to decode several messages with the same instance"""
+        wire_msg = WireMessage()
+        wire_msg.ParseFromString(new_message().SerializeToString())
+        self.assertEqual(wire_msg.fromPort, 53000)
+
+        dns_pb2 = PBDNSMessage()
+        dns_pb2.type = PBDNSMessage.Type.DNSQueryType
+        wire_msg.ParseFromString(dns_pb2.SerializeToString())
+        self.assertSameMessage(dns_pb2, wire_msg)
+        self.assertEqual(wire_msg.fromPort, 0)
+
+    def test5_malformed(self):
+        """test malformed payload"""
+        wire_msg = WireMessage()
+        with self.assertRaises(DecodeError):
+            wire_msg.ParseFromString(new_message().SerializeToString()[:-3])
+
+        # missing required type, decoded as the generated class does
+        wire_msg.ParseFromString(b"")
+        self.assertSameMessage(PBDNSMessage(), wire_msg)
+
+    def test6_message_list(self):
+        """test to split a PBDNSMessageList without decoding"""
+        from pdns_protobuf_receiver.dnsmessage_pb2 import PBDNSMessageList
+        from pdns_protobuf_receiver import wire
+
+        payloads = []
+        for i in range(3):
+            dns_pb2 = new_message()
+            dns_pb2.id = i
+            payloads.append(dns_pb2.SerializeToString())
+
+        dns_list = PBDNSMessageList()
+        dns_list.ParseFromString(b"".join(wire.encode_message_list_entry(p) for p in payloads))
+
+        payload = dns_list.SerializeToString()
+        self.assertTrue(wire.is_message_list(payload))
+        self.assertFalse(wire.is_message_list(payloads[0]))
+        self.assertEqual(wire.split_message_list(payload), payloads)
+        self.assertEqual([m.id for m in dns_list.msg], [0, 1, 2])